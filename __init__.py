@@ -1,17 +1,27 @@
 import os
+import json
 import logging
+import threading
+from typing import Dict
 from dotenv import load_dotenv, find_dotenv
-from flask import Flask, request, make_response, send_from_directory
+from flask import Flask, request, make_response, send_file, jsonify
+from werkzeug.security import safe_join
 
 from slack_config import slack_signature_verifier
 from commands import run_report_command, run_confing_command
 from util import (
     serialize_to_dict,
-    check_config,
     get_config_command,
     get_consult_command,
+    CommandParseError,
 )
+from channel_config import check_config
 from slack_response import SlackResponse
+from job_queue import DUPLICATE, REJECTED
+from request_intake import event_intake, request_intake
+from metrics import ack_latency, event_ack_latency
+from report_cache import report_cache
+from event_ingest import handle_event
 
 load_dotenv(find_dotenv())
 
@@ -20,7 +30,19 @@ logging.basicConfig(level=logging.INFO)
 if not os.path.isdir("./channels"):
     os.mkdir("./channels")
 
+channels_dir = os.path.abspath("./channels")
+report_max_age = int(os.environ.get("REPORT_MAX_AGE") or 3600)
+event_record_file = os.environ.get("EVENT_RECORD_FILE")
+event_record_lock = threading.Lock()
+busy_status = ":hourglass: Failed request - busy"
+busy_message = "Too many requests are being processed right now. Please try again in a few minutes."
+
 app = Flask(__name__)
+app.config["USE_X_SENDFILE"] = os.environ.get("USE_X_SENDFILE", "").lower() in (
+    "1",
+    "true",
+    "yes",
+)
 
 config_err_blocks = [
     {
@@ -44,7 +66,7 @@ consult_err_blocks = [
         "type": "section",
         "text": {
             "type": "mrkdwn",
-            "text": "*Valid commands:* all, handled, unhandled, with-ping-word",
+            "text": "*Valid commands:* all, handled, unhandled, with-ping-word, bundle, audit, stats, latency",
         },
     },
     {
@@ -58,30 +80,70 @@ consult_err_blocks = [
         "type": "section",
         "text": {
             "type": "mrkdwn",
-            "text": "*Examples*:\n\t• All consults between two dates: /consults all from 01/01/2022 to 01/02/2022\n\t• Handled consults on a specific date: /consults handled on 01/01/2022",
+            "text": "*Examples*:\n\t• All consults between two dates: /consults all from 01/01/2022 to 01/02/2022\n\t• Handled consults on a specific date: /consults handled on 01/01/2022\n\t• All four reports from a single fetch: /consults bundle on 01/01/2022\n\t• All consults of every channel you are a consult agent in, in one file: /consults audit from 01/01/2022 to 31/01/2022\n\t• Consult counts per category and agent: /consults stats from 01/01/2022 to 31/01/2022\n\t• Time to first agent reply per agent: /consults latency from 01/01/2022 to 31/01/2022",
         },
     },
     {
         "type": "section",
         "text": {
             "type": "mrkdwn",
-            "text": "To view accepted date formats use: /consults formats",
+            "text": "To view accepted date and report formats use: /consults formats",
         },
     },
 ]
 
 
+def busy_response(params: Dict):
+    response = SlackResponse(
+        channel_id=params["channel_id"],
+        slack_user_id=params["user_id"],
+        status=busy_status,
+        message=busy_message,
+    )
+
+    return make_response(response.get_message_blocks(), 200)
+
+
+def send_job_status(status: str, params: Dict) -> None:
+    if status == REJECTED:
+        response = SlackResponse(
+            channel_id=params["channel_id"],
+            slack_user_id=params["user_id"],
+            status=busy_status,
+            message=busy_message,
+        )
+
+        return response.send()
+
+    if status == DUPLICATE:
+        response = SlackResponse(
+            channel_id=params["channel_id"],
+            slack_user_id=params["user_id"],
+            status=":hourglass: Request already in progress",
+            message="An identical request is already being processed. You will receive the result shortly.",
+        )
+
+        return response.send()
+
+
 @app.route("/consult_configs", methods=["POST"])
+@ack_latency.timed
 def create_channel_config():
-    try:
-        data_bytes = request.get_data()
+    data_bytes = request.get_data()
+
+    if not slack_signature_verifier.is_valid_request(data_bytes, request.headers):
+        return make_response("Unauthorized request.", 403)
 
-        if not slack_signature_verifier.is_valid_request(data_bytes, request.headers):
-            return make_response("Unauthorized request.", 403)
+    params = serialize_to_dict(data_bytes)
 
-        if data_bytes:
-            params = serialize_to_dict(data_bytes)
+    if not request_intake.submit(handle_channel_config_request, params):
+        return busy_response(params)
 
+    return make_response()
+
+
+def handle_channel_config_request(params: Dict) -> None:
+    try:
         if not "text" in params:
             response = SlackResponse(
                 channel_id=params["channel_id"],
@@ -91,32 +153,33 @@ def create_channel_config():
 
             response.set_custom_message_blocks(config_err_blocks)
 
-            return make_response(response.get_message_blocks(), 200)
+            return response.send()
 
         else:
             command = get_config_command(params["text"])
-            run_confing_command(
+            status = run_confing_command(
                 command,
                 params["user_id"],
                 params["channel_id"],
             )
 
-            return make_response()
+            return send_job_status(status, params)
 
-    except ValueError:
-        logging.exception(f"Exception occured handling a POST request")
+    except CommandParseError as e:
+        logging.info(f"Invalid command: {e}")
 
         response = SlackResponse(
             channel_id=params["channel_id"],
             slack_user_id=params["user_id"],
             status=":x: Failed request - invalid",
+            message=str(e),
         )
 
         response.set_custom_message_blocks(config_err_blocks)
 
-        return make_response(response.get_message_blocks(), 200)
+        return response.send()
 
-    except IndexError:
+    except (ValueError, IndexError):
         logging.exception(f"Exception occured handling a POST request")
 
         response = SlackResponse(
@@ -127,7 +190,7 @@ def create_channel_config():
 
         response.set_custom_message_blocks(config_err_blocks)
 
-        return make_response(response.get_message_blocks(), 200)
+        return response.send()
 
     except Exception:
         logging.exception(f"Exception occured handling a POST request")
@@ -139,20 +202,27 @@ def create_channel_config():
             message="Something went awry!",
         )
 
-        return make_response(response.get_message_blocks(), 200)
+        return response.send()
 
 
 @app.route("/consults", methods=["POST"])
+@ack_latency.timed
 def create_report():
-    try:
-        data_bytes = request.get_data()
+    data_bytes = request.get_data()
+
+    if not slack_signature_verifier.is_valid_request(data_bytes, request.headers):
+        return make_response("Unauthorized request.", 403)
+
+    params = serialize_to_dict(data_bytes)
 
-        if not slack_signature_verifier.is_valid_request(data_bytes, request.headers):
-            return make_response("Unauthorized request.", 403)
+    if not request_intake.submit(handle_report_request, params):
+        return busy_response(params)
 
-        if data_bytes:
-            params = serialize_to_dict(data_bytes)
+    return make_response()
 
+
+def handle_report_request(params: Dict) -> None:
+    try:
         config = check_config(params["channel_id"])
 
         if not config["is_config_file"]:
@@ -163,7 +233,7 @@ def create_report():
                 message="No configuration found. You will need to configure the bot for this channel using the command: '/consult-config'.",
             )
 
-            return make_response(response.get_message_blocks(), 200)
+            return response.send()
 
         if config["empty_keys"]:
             response = SlackResponse(
@@ -173,7 +243,7 @@ def create_report():
                 message=f"Missing configurations: {', '.join(config['empty_keys'])}",
             )
 
-            return make_response(response.get_message_blocks(), 200)
+            return response.send()
 
         if not "text" in params:
             response = SlackResponse(
@@ -184,14 +254,28 @@ def create_report():
 
             response.set_custom_message_blocks(consult_err_blocks)
 
-            return make_response(response.get_message_blocks(), 200)
+            return response.send()
 
         else:
             command = get_consult_command(params["text"])
 
-            run_report_command(command, params["user_id"], config["data"])
+            status = run_report_command(command, params["user_id"], config["data"])
 
-            return make_response()
+            return send_job_status(status, params)
+
+    except CommandParseError as e:
+        logging.info(f"Invalid command: {e}")
+
+        response = SlackResponse(
+            channel_id=params["channel_id"],
+            slack_user_id=params["user_id"],
+            status=":x: Failed request - invalid",
+            message=str(e),
+        )
+
+        response.set_custom_message_blocks(consult_err_blocks)
+
+        return response.send()
 
     except ValueError:
         logging.exception(f"Exception occured handling a POST request")
@@ -204,7 +288,7 @@ def create_report():
 
         response.set_custom_message_blocks(consult_err_blocks)
 
-        return make_response(response.get_message_blocks(), 200)
+        return response.send()
 
     except Exception:
         logging.exception(f"Exception occured handling a POST request")
@@ -215,17 +299,80 @@ def create_report():
             message="Something went awry!",
         )
 
-        return make_response(response.get_message_blocks(), 200)
+        return response.send()
+
+
+@app.route("/events", methods=["POST"])
+@event_ack_latency.timed
+def receive_event():
+    data_bytes = request.get_data()
+
+    if not slack_signature_verifier.is_valid_request(data_bytes, request.headers):
+        return make_response("Unauthorized request.", 403)
+
+    payload = json.loads(data_bytes)
+
+    if payload.get("type") == "url_verification":
+        return jsonify({"challenge": payload["challenge"]})
+
+    if event_record_file:
+        with event_record_lock, open(event_record_file, "a") as record_file:
+            record_file.write(json.dumps(payload) + "\n")
+
+    # A non-2xx response makes Slack deliver the event again later.
+    if not event_intake.submit(handle_event, payload):
+        return make_response("Busy", 503)
+
+    return make_response()
+
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    return jsonify(
+        {
+            "ack_latency": ack_latency.summary(),
+            "event_ack_latency": event_ack_latency.summary(),
+        }
+    )
 
 
 @app.route(f"/channels/<channel_id>/reports/<report_name>", methods=["GET"])
 def get_report(channel_id, report_name):
-    if not os.path.isfile(f"./channels/{channel_id}/reports/{report_name}"):
+    file_path = safe_join(channels_dir, channel_id, "reports", report_name)
+
+    if file_path is None:
         return make_response("File not found", 404)
 
-    return send_from_directory(
-        f"./channels/{channel_id}/reports", report_name, as_attachment=True
-    )
+    try:
+        response = send_file(
+            file_path,
+            as_attachment=True,
+            conditional=True,
+            etag=True,
+            mimetype=_report_mimetype(report_name),
+            max_age=report_max_age,
+        )
+
+    except (FileNotFoundError, IsADirectoryError):
+        return make_response("File not found", 404)
+
+    report_cache.touch(file_path)
+
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.accept_ranges = "bytes"
+
+    return response
+
+
+def _report_mimetype(report_name: str) -> str:
+    if report_name.endswith(".gz"):
+        return "application/gzip"
+
+    if report_name.endswith(".jsonl"):
+        return "application/x-ndjson"
+
+    return "text/csv"
 
 
 if __name__ == "__main__":
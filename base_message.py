@@ -1,222 +1,296 @@
 import logging
+import itertools
+import time
+import threading
 from datetime import datetime
 import os
 from dotenv import load_dotenv, find_dotenv
-from typing import Dict
+from typing import Dict, Iterator, List, Optional, Tuple
 
-from slack_config import slack_client, slack_errors
-from slack_response import SlackResponse
+from slack_config import slack_client
+from user_cache import unresolved_profile, user_profile_cache
+from message_store import MessageStore
+from history_fetcher import HistoryFetcher, fetch_thread_replies
+from util import convert_date_to_timestamp
+from channel_config import ChannelConfig
+from consult_record import ConsultClassifier, ConsultRecord, ignore_subtypes
 
 logging.basicConfig(level=logging.INFO)
 
+replies_batch_size = 200
+
 
 class BaseMessage:
     def __init__(
         self,
-        config: Dict,
+        config: ChannelConfig,
         oldest_date: str,
         latest_date: str,
         utc_offset: str,
         slack_user_id: str,
     ):
         self._slack_client = slack_client
+        self._user_profiles = user_profile_cache
         self._slack_user_id = slack_user_id
         self._config = config
         self._oldest_timestamp = self._convert_date_to_timestamp(oldest_date)
         self._latest_timestamp = self._convert_date_to_timestamp(latest_date)
-        self._channel_messages = []
         self._utc_offset = utc_offset
 
+        load_dotenv(find_dotenv())
+
+        self._tz_info = datetime.strptime(utc_offset, "%z").tzinfo
+        self._slack_link_prefix = f"https://{os.environ['WORKSPACE']}.slack.com/archives/{config['channel_id']}/p"
+        self._classifier = ConsultClassifier(config)
+        self._agent_ids = config.agent_ids
+
+    def iter_consult_messages(self) -> Iterator[ConsultRecord]:
+        message_store = MessageStore(self._config["channel_id"])
+
         try:
-            conversation = self._slack_client.conversations_history(
-                channel=self._config["channel_id"],
-                limit=100,
-                oldest=self._oldest_timestamp,
-                latest=self._latest_timestamp,
-                inclusive=True,
-            )
+            threading.Thread(
+                target=self._user_profiles.prefetch,
+                args=(self._config["consult_agent_ids"],),
+            ).start()
 
-            ignore_subtypes = [
-                "bot_message",
-                "me_message",
-                "channel_join",
-                "channel_leave",
-                "channel_topic",
-                "channel_purpose",
-                "channel_name",
-                "channel_archive",
-                "channel_unarchive",
-                "file_share",
-                "channel_posting_permissions",
+            missing_ranges = message_store.missing_ranges(
+                self._oldest_timestamp, min(self._latest_timestamp, time.time())
+            )
+            segments = [
+                (latest, oldest, None)
+                for oldest, latest in message_store.covered_ranges(
+                    self._oldest_timestamp, self._latest_timestamp
+                )
+            ] + [
+                (latest, oldest, range_index)
+                for range_index, (oldest, latest) in enumerate(missing_ranges)
             ]
+            last_ts = None
 
-            if conversation["messages"]:
-                for message in conversation["messages"]:
-                    if ("subtype" in message) and (
-                        message["subtype"] in ignore_subtypes
-                    ):
-                        continue
-
-                    consult_message = self._convert_slack_message_to_consult_message(
-                        message, self._config, self._utc_offset
-                    )
-                    self._channel_messages.append(consult_message)
+            with HistoryFetcher(self._config["channel_id"], missing_ranges) as fetcher:
+                for latest, oldest, range_index in sorted(segments, reverse=True):
+                    if range_index is None:
+                        messages = (
+                            (message, None)
+                            for message in message_store.iter_messages(oldest, latest)
+                        )
+                    else:
+                        messages = self._iter_fetched_messages(
+                            message_store,
+                            fetcher,
+                            range_index,
+                            missing_ranges[range_index],
+                        )
 
-                while conversation["has_more"]:
-                    conversation = self._slack_client.conversations_history(
-                        channel=self._config["channel_id"],
-                        limit=100,
-                        cursor=conversation["response_metadata"]["next_cursor"],
-                    )
-                    for message in conversation["messages"]:
+                    for message, consult_message in messages:
                         if ("subtype" in message) and (
                             message["subtype"] in ignore_subtypes
                         ):
                             continue
 
-                        consult_message = (
-                            self._convert_slack_message_to_consult_message(
-                                message, self._config, self._utc_offset
-                            )
+                        if (last_ts is not None) and (float(message["ts"]) >= last_ts):
+                            continue
+
+                        last_ts = float(message["ts"])
+
+                        yield self._convert_slack_message_to_consult_message(
+                            message, consult_message
                         )
-                        self._channel_messages.append(consult_message)
 
-        except slack_errors.SlackApiError:
-            logging.exception(f"Exception while fetching messages")
+            for oldest, latest in missing_ranges:
+                message_store.mark_synced(oldest, latest)
 
-            response = SlackResponse(
-                channel_id=self._config["channel_id"],
-                slack_user_id=slack_user_id,
-                status=":aaaaaaaa: Failed request - server error",
-                message="Something went awry!",
+        finally:
+            message_store.close()
+
+    def store_revision(self) -> Optional[float]:
+        # The revision changes when a missing part of the range is fetched
+        # into the store, so it is only known once the range is fully synced.
+        message_store = MessageStore(self._config["channel_id"])
+
+        try:
+            if message_store.missing_ranges(
+                self._oldest_timestamp, min(self._latest_timestamp, time.time())
+            ):
+                return None
+
+            return message_store.last_updated(
+                self._oldest_timestamp, self._latest_timestamp
             )
-            response.send()
 
-        except Exception:
-            logging.exception(f"Exception during class instantiation")
+        finally:
+            message_store.close()
+
+    def consult_stats(self) -> Dict:
+        message_store = MessageStore(self._config["channel_id"])
 
-            response = SlackResponse(
-                channel_id=self._config["channel_id"],
-                slack_user_id=slack_user_id,
-                status=":aaaaaaaa: Failed request - server error",
-                message="Something went awry!",
+        try:
+            self._sync_messages(
+                message_store, self._oldest_timestamp, self._latest_timestamp
             )
-            response.send()
 
-    def _convert_slack_message_to_consult_message(
-        self, slack_message: Dict, config: Dict, utc_offset: str
-    ) -> Dict:
-        tz_info = datetime.strptime(utc_offset, "%z").tzinfo
+            return message_store.consult_stats(
+                self._oldest_timestamp, self._latest_timestamp
+            )
 
-        load_dotenv(find_dotenv())
+        finally:
+            message_store.close()
+
+    def iter_handling_latencies(
+        self,
+    ) -> Iterator[Tuple[ConsultRecord, Optional[float], Optional[float]]]:
+        message_store = MessageStore(self._config["channel_id"])
+
+        try:
+            self._sync_messages(
+                message_store, self._oldest_timestamp, self._latest_timestamp
+            )
+
+            consults = (
+                message
+                for message in message_store.iter_messages(
+                    self._oldest_timestamp, self._latest_timestamp
+                )
+                if (message.get("subtype") not in ignore_subtypes)
+                and self._agent_ids.intersection(message.get("reply_users", ()))
+            )
+
+            # Threads are looked up and fetched a batch at a time, so only one
+            # batch of consults and replies is held in memory.
+            while True:
+                batch = list(itertools.islice(consults, replies_batch_size))
+
+                if not batch:
+                    break
+
+                threads = self._get_first_replies(message_store, batch)
+
+                for message in batch:
+                    if message["ts"] not in threads:
+                        continue
+
+                    first_replies = threads[message["ts"]]
+                    consult_message = self._convert_slack_message_to_consult_message(
+                        message
+                    )
+                    agent_replies = [
+                        first_replies[agent_id]
+                        for agent_id in self._agent_ids
+                        if agent_id in first_replies
+                    ]
+
+                    yield (
+                        consult_message,
+                        (
+                            min(agent_replies) - consult_message.ts
+                            if agent_replies
+                            else None
+                        ),
+                        (
+                            first_replies[consult_message.agent_id] - consult_message.ts
+                            if consult_message.agent_id in first_replies
+                            else None
+                        ),
+                    )
+
+        finally:
+            message_store.close()
+
+    def _sync_messages(
+        self, message_store: MessageStore, oldest: float, latest: float
+    ) -> None:
+        missing_ranges = message_store.missing_ranges(oldest, min(latest, time.time()))
+
+        with HistoryFetcher(self._config["channel_id"], missing_ranges) as fetcher:
+            for range_index, (range_oldest, range_latest) in enumerate(missing_ranges):
+                timestamps = set()
+
+                for page in fetcher.range_pages(range_index):
+                    message_store.save_messages(page)
+                    timestamps.update(message["ts"] for message in page)
+
+                message_store.delete_missing(range_oldest, range_latest, timestamps)
+
+        for oldest, latest in missing_ranges:
+            message_store.mark_synced(oldest, latest)
 
-        consult_message = {
-            "created": datetime.fromtimestamp(
-                float(slack_message["ts"]), tz_info
-            ).strftime("%d/%m/%Y %H:%M:%S %Z"),
-            "has_ping_word": False,
-            "is_handled": False,
-            "topic": None,
-            "research": None,
-            "slack_link": f"https://{os.environ['WORKSPACE']}.slack.com/archives/{config['channel_id']}/p{str(slack_message['ts']).replace('.', '')}",
-            "handled_by": {},
+    def _iter_fetched_messages(
+        self,
+        message_store: MessageStore,
+        fetcher: HistoryFetcher,
+        range_index: int,
+        fetched_range: Tuple[float, float],
+    ) -> Iterator[Tuple[Dict, Optional[ConsultRecord]]]:
+        timestamps = set()
+
+        for page in fetcher.range_pages(range_index):
+            # Each page is classified once, for both the report and the
+            # message store's counters.
+            consult_messages = {
+                message["ts"]: self._classifier.classify(message)
+                for message in page
+                if message.get("subtype") not in ignore_subtypes
+            }
+            message_store.save_messages(page, consult_messages, self._config.version)
+
+            timestamps.update(message["ts"] for message in page)
+
+            for message in page:
+                yield message, consult_messages.get(message["ts"])
+
+        message_store.delete_missing(*fetched_range, timestamps)
+
+    def _get_first_replies(
+        self, message_store: MessageStore, messages: List[Dict]
+    ) -> Dict[str, Dict[str, float]]:
+        threads = message_store.get_thread_replies(
+            [message["ts"] for message in messages]
+        )
+        latest_replies = {
+            message["ts"]: message.get("latest_reply")
+            for message in messages
+            if (message["ts"] not in threads)
+            or (threads[message["ts"]][0] != message.get("latest_reply"))
         }
+        fetched_threads = {}
 
-        if any(
-            message_ping_word.lower()
-            in ("".join(slack_message["text"].split()).lower())
-            for message_ping_word in config["channel_ping_words"]
-        ):
-            consult_message["has_ping_word"] = True
-
-        if ("reactions" in slack_message) and ("reply_users" in slack_message):
-            if any(
-                name == config["reaction_for_handling"]
-                for name in [
-                    reaction["name"] for reaction in slack_message["reactions"]
-                ]
-            ):
-                for reaction in slack_message["reactions"]:
-                    if reaction["name"] == config["reaction_for_handling"]:
-                        for reaction_user in reaction["users"]:
-                            if reaction_user == slack_message["user"]:
-                                break
-
-                            if (reaction_user in slack_message["reply_users"]) and (
-                                reaction_user in config["consult_agent_ids"]
-                            ):
-                                try:
-                                    consult_agent = self._slack_client.users_info(
-                                        user=reaction_user
-                                    )
-                                    consult_message["handled_by"][
-                                        "name"
-                                    ] = consult_agent["user"]["profile"]["real_name"]
-                                    consult_message["handled_by"][
-                                        "email"
-                                    ] = consult_agent["user"]["profile"]["email"]
-
-                                    consult_message["is_handled"] = True
-
-                                except slack_errors.SlackApiError:
-                                    logging.exception(
-                                        f"Error fetching Slack user: {reaction_user}"
-                                    )
-
-                                if not consult_message["topic"]:
-                                    consult_message["topic"] = "valid"
-
-                                if not consult_message["research"]:
-                                    consult_message["research"] = "provided"
-
-                    if reaction["name"] == config["reaction_for_invalid"]:
-                        consult_message["topic"] = "invalid"
-
-                    if reaction["name"] == config["reaction_for_no_research"]:
-                        consult_message["research"] = "none"
+        for ts, replies in fetch_thread_replies(
+            self._config["channel_id"], list(latest_replies)
+        ).items():
+            if replies is not None:
+                fetched_threads[ts] = (latest_replies[ts], _first_replies(ts, replies))
+
+        message_store.save_thread_replies(fetched_threads)
+        threads.update(fetched_threads)
+
+        return {ts: first_replies for ts, (_, first_replies) in threads.items()}
+
+    def _convert_slack_message_to_consult_message(
+        self, slack_message: Dict, consult_message: Optional[ConsultRecord] = None
+    ) -> ConsultRecord:
+        if consult_message is None:
+            consult_message = self._classifier.classify(slack_message)
+
+        if consult_message.agent_id is not None:
+            consult_message.handled_by = self._user_profiles.get(
+                consult_message.agent_id
+            ) or unresolved_profile(consult_message.agent_id)
 
         return consult_message
 
     def _convert_date_to_timestamp(self, date_string):
-        if date_string:
-            for format in (
-                "%d%b%Y",
-                "%d%b%Y,%z",
-                "%d%b%Y,%H:%M",
-                "%d%b%Y,%H:%M%z",
-                "%d%b%Y,%H:%M:%S",
-                "%d%b%Y,%H:%M:%S%z",
-                "%d%B%Y",
-                "%d%B%Y,%z",
-                "%d%B%Y,%H:%M",
-                "%d%B%Y,%H:%M%z",
-                "%d%B%Y,%H:%M:%S",
-                "%d%B%Y,%H:%M:%S%z",
-                "%d/%m/%Y",
-                "%d/%m/%Y,%z",
-                "%d/%m/%Y,%H:%M",
-                "%d/%m/%Y,%H:%M%z",
-                "%d/%m/%Y,%H:%M:%S",
-                "%d/%m/%Y,%H:%M:%S%z",
-                "%d.%m.%Y",
-                "%d.%m.%Y,%z",
-                "%d.%m.%Y,%H:%M",
-                "%d.%m.%Y,%H:%M%z",
-                "%d.%m.%Y,%H:%M:%S",
-                "%d.%m.%Y,%H:%M:%S%z",
-                "%d-%m-%Y",
-                "%d-%m-%Y,%z",
-                "%d-%m-%Y,%H:%M",
-                "%d-%m-%Y,%H:%M%z",
-                "%d-%m-%Y,%H:%M:%S",
-                "%d-%m-%Y,%H:%M:%S%z",
-            ):
-                try:
-                    return datetime.strptime(date_string, format).timestamp()
-                except ValueError:
-                    pass
+        return convert_date_to_timestamp(date_string)
+
+
+def _first_replies(thread_ts: str, replies: List[Dict]) -> Dict[str, float]:
+    first_replies = {}
+
+    for reply in replies:
+        if (reply["ts"] == thread_ts) or ("user" not in reply):
+            continue
 
-            raise ValueError("Invalid date format")
+        first_replies[reply["user"]] = min(
+            float(reply["ts"]), first_replies.get(reply["user"], float("inf"))
+        )
 
-        else:
-            return None
+    return first_replies
@@ -0,0 +1,172 @@
+import os
+import json
+import copy
+import fcntl
+import tempfile
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+from util import get_ping_word_matcher
+
+
+class ChannelConfig(dict):
+    def __init__(self, data: Dict) -> None:
+        data = dict(data)
+        self.version = data.pop("version", 0)
+
+        super().__init__(data)
+
+        self.empty_keys = [k for k, v in self.items() if not v]
+        self.ping_word_matcher = get_ping_word_matcher(
+            tuple(self.get("channel_ping_words") or ())
+        )
+        self.agent_ids = frozenset(self.get("consult_agent_ids") or ())
+
+
+class ChannelConfigCache:
+    def __init__(self) -> None:
+        self._configs: Dict[str, Dict] = {}
+        self._channel_locks = defaultdict(threading.Lock)
+        self._lock = threading.Lock()
+
+    def get(self, slack_channel_id: str) -> Optional[ChannelConfig]:
+        try:
+            stat = os.stat(f"./channels/{slack_channel_id}/config.json")
+
+        except FileNotFoundError:
+            with self._lock:
+                self._configs.pop(slack_channel_id, None)
+
+            return None
+
+        with self._lock:
+            entry = self._configs.get(slack_channel_id)
+
+            if entry and entry["stat"] == _file_version(stat):
+                return entry["config"]
+
+        with open(f"./channels/{slack_channel_id}/config.json", "r") as file:
+            config = ChannelConfig(json.load(file))
+
+        with self._lock:
+            self._configs[slack_channel_id] = {
+                "config": config,
+                "stat": _file_version(stat),
+            }
+
+        return config
+
+    def configured(self) -> List[ChannelConfig]:
+        configs = []
+
+        for slack_channel_id in sorted(os.listdir("./channels")):
+            config = self.get(slack_channel_id)
+
+            if (config is not None) and (not config.empty_keys):
+                configs.append(config)
+
+        return configs
+
+    def get_or_create(self, slack_channel_id: str, default: Dict) -> ChannelConfig:
+        config = self.get(slack_channel_id)
+
+        if config is not None:
+            return config
+
+        with self._locked(slack_channel_id):
+            return self.get(slack_channel_id) or self._write(
+                slack_channel_id, default, version=1
+            )
+
+    def update(
+        self, slack_channel_id: str, update: Callable[[Dict], None], default: Dict
+    ) -> ChannelConfig:
+        with self._locked(slack_channel_id):
+            config = self.get(slack_channel_id)
+
+            if config is None:
+                data, version = copy.deepcopy(default), 0
+            else:
+                data, version = copy.deepcopy(dict(config)), config.version
+
+            update(data)
+
+            return self._write(slack_channel_id, data, version=version + 1)
+
+    @contextmanager
+    def _locked(self, slack_channel_id: str) -> Iterator[None]:
+        os.makedirs(f"./channels/{slack_channel_id}/reports", exist_ok=True)
+
+        with self._lock:
+            channel_lock = self._channel_locks[slack_channel_id]
+
+        with channel_lock, open(
+            f"./channels/{slack_channel_id}/config.lock", "w"
+        ) as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            try:
+                yield
+
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write(self, slack_channel_id: str, data: Dict, version: int) -> ChannelConfig:
+        file_descriptor, temp_path = tempfile.mkstemp(
+            dir=f"./channels/{slack_channel_id}", prefix=".config.", suffix=".tmp"
+        )
+
+        try:
+            with os.fdopen(file_descriptor, "w") as file:
+                json.dump({**data, "version": version}, file, indent=4)
+                file.flush()
+                os.fsync(file.fileno())
+
+            os.replace(temp_path, f"./channels/{slack_channel_id}/config.json")
+
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+            raise
+
+        stat = os.stat(f"./channels/{slack_channel_id}/config.json")
+        config = ChannelConfig({**data, "version": version})
+
+        with self._lock:
+            self._configs[slack_channel_id] = {
+                "config": config,
+                "stat": _file_version(stat),
+            }
+
+        return config
+
+
+def _file_version(stat: os.stat_result) -> tuple:
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+channel_configs = ChannelConfigCache()
+
+
+def check_config(slack_channel_id: str) -> Dict:
+    res = {"is_config_file": False, "data": {}, "empty_keys": []}
+
+    config = channel_configs.get(slack_channel_id)
+
+    if config is None:
+        return res
+
+    res["is_config_file"] = True
+
+    if len(config.empty_keys) > 0:
+        res["empty_keys"] = config.empty_keys
+
+        return res
+
+    else:
+        res["data"] = config
+
+        return res
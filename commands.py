@@ -1,47 +1,162 @@
-import threading
 import time
 import logging
-import os
 import json
-from typing import List, Dict
+from typing import Callable, List, Dict, Optional, Tuple
 
-from slack_config import slack_client
-from consult_message import ConsultMessage
-from util import extract_dates_from_string, check_config
+from consult_message import ConsultMessage, generate_merged_csv
+from util import convert_date_to_timestamp, get_date_range
+from channel_config import ChannelConfig, channel_configs
 from slack_response import SlackResponse
+from job_queue import Job, job_scheduler
+from report_cache import cache_key, report_cache
+
+report_file_prefixes = {
+    "all": "all_consults",
+    "handled": "handled_consults",
+    "unhandled": "unhandled_consults",
+    "with-ping-word": "consults_with_ping_word",
+}
 
 
 def run_confing_command(
     command: Dict,
     slack_user_id: str,
     slack_channel_id: str,
-) -> None:
+) -> str:
     kwargs = {
         "command": command,
         "slack_user_id": slack_user_id,
         "slack_channel_id": slack_channel_id,
     }
 
-    threading.Thread(target=_config_command_background_task, kwargs=kwargs).start()
+    return job_scheduler.submit(
+        Job(
+            key=(
+                "config",
+                slack_channel_id,
+                slack_user_id,
+                json.dumps(command, sort_keys=True),
+            ),
+            slack_channel_id=slack_channel_id,
+            slack_user_id=slack_user_id,
+            target=_config_command_background_task,
+            kwargs=kwargs,
+        )
+    )
 
 
 def run_report_command(
     command: Dict,
     slack_user_id: str,
     config: Dict,
-) -> None:
+) -> str:
     kwargs = {
         "command": command,
         "slack_user_id": slack_user_id,
         "config": config,
     }
 
-    threading.Thread(target=_report_command_background_task, kwargs=kwargs).start()
+    job = Job(
+        key=_get_report_key(command, slack_user_id, config),
+        slack_channel_id=config["channel_id"],
+        slack_user_id=slack_user_id,
+        target=_report_command_background_task,
+        kwargs=kwargs,
+    )
+    kwargs["recipients"] = job.recipients
+
+    return job_scheduler.submit(job)
+
+
+def _get_report_key(command: Dict, slack_user_id: str, config: Dict) -> Tuple:
+    try:
+        date_range = get_date_range(command)
+
+        return (
+            "report",
+            config["channel_id"],
+            command["name"],
+            # Each requester's audit covers a different set of channels, so
+            # it is never shared with other users' identical requests.
+            slack_user_id if command["name"] == "audit" else None,
+            convert_date_to_timestamp(date_range["oldest_date"]),
+            convert_date_to_timestamp(date_range["latest_date"]),
+            date_range["utc_offset"],
+            command["args"].get("format", "csv"),
+        )
+
+    except (KeyError, IndexError, ValueError):
+        return (
+            "report",
+            config["channel_id"],
+            slack_user_id,
+            json.dumps(command, sort_keys=True),
+        )
+
+
+def _get_report_file_names(
+    prefixes: Dict[str, str],
+    channels: List[Tuple[ChannelConfig, ConsultMessage]],
+    range_key: Tuple,
+    report_format: str,
+) -> Optional[Dict[str, str]]:
+    if not report_cache.is_closed(range_key[1]):
+        return None
+
+    config_key = []
+
+    for channel_config, consult_message in channels:
+        revision = consult_message.store_revision()
+
+        # Until the range is fully synced the report cannot be named after
+        # the data it will contain.
+        if revision is None:
+            return None
+
+        config_key.append(
+            (channel_config["channel_id"], channel_config.version, revision)
+        )
+
+    return {
+        view: f"{prefix}_{cache_key(view, config_key, *range_key)}.{report_format}"
+        for view, prefix in prefixes.items()
+    }
+
+
+def _get_temporary_file_names(
+    prefixes: Dict[str, str], report_format: str, current_time: float
+) -> Dict[str, str]:
+    return {
+        view: f"{prefix}_{current_time}.{report_format}"
+        for view, prefix in prefixes.items()
+    }
+
+
+def _format_latency(summary: Dict) -> str:
+    return f"p50 {_format_duration(summary['p50'])}, p90 {_format_duration(summary['p90'])}, p99 {_format_duration(summary['p99'])} ({summary['count']} consults)"
+
+
+def _format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(round(max(0.0, seconds))), 60)
+    hours, minutes = divmod(minutes, 60)
+
+    if hours:
+        return f"{hours}h {minutes:02d}m"
+
+    if minutes:
+        return f"{minutes}m {seconds:02d}s"
+
+    return f"{seconds}s"
 
 
 def _report_command_background_task(
-    command: Dict, slack_user_id: str, config: Dict
+    command: Dict,
+    slack_user_id: str,
+    config: Dict,
+    recipients: Callable[[], List[str]] = None,
 ) -> None:
+    recipients = recipients or (lambda: [slack_user_id])
+
     try:
         if command["name"] == "formats":
             response = SlackResponse(
@@ -78,6 +193,13 @@ def _report_command_background_task(
                         "text": "You can include a specific time of day as well as a UTC time offset. If included, it must come after the date, separated with a single comma.\n\nYou can include the ofsset without the time, and the time without the ofsset, but if both are included the offset must come after the time.\n\nWhen specifying a date range (i.e. 'from 01/01/2022 to 31/01/2022'), note that you can include the offset after both dates, however only the first offset will be taken into consideration.",
                     },
                 },
+                {
+                    "type": "section",
+                    "text": {
+                        "type": "mrkdwn",
+                        "text": "*Supported report formats:*\n\t• csv - plain CSV (default)\n\t• csv.gz - gzip-compressed CSV\n\t• jsonl - one JSON object per line\n\t• jsonl.gz - gzip-compressed JSON Lines\n\nThe format is selected with the --format argument, e.g. /consults all on 01/01/2022 --format=csv.gz",
+                    },
+                },
                 {
                     "type": "section",
                     "text": {
@@ -90,50 +212,54 @@ def _report_command_background_task(
             response.set_custom_message_blocks(blocks)
             return response.send()
 
-        date_time_list = extract_dates_from_string(command["args"]["date_time"])
+        date_range = get_date_range(command)
+        report_format = command["args"].get("format", "csv")
         current_time = time.time()
+        range_key = (
+            convert_date_to_timestamp(date_range["oldest_date"]),
+            convert_date_to_timestamp(date_range["latest_date"]),
+            date_range["utc_offset"],
+        )
 
-        def check_argument_and_create_csv():
-            if command["name"] == "all":
-                messages = consult_message.all_messages()
-
-                return consult_message.generate_csv(
-                    messages, f"all_consults_{current_time}.csv"
-                )
-
-            if command["name"] == "handled":
-                messages = consult_message.handled_messages()
+        if command["name"] == "stats":
+            consult_message = ConsultMessage(
+                config, slack_user_id=slack_user_id, **date_range
+            )
+            stats = consult_message.consult_stats()
 
-                return consult_message.generate_csv(
-                    messages, f"handled_consults_{current_time}.csv"
+            if stats["total"] == 0:
+                response = SlackResponse(
+                    channel_id=config["channel_id"],
+                    slack_user_id=slack_user_id,
+                    status=":question: Failed request - not found",
+                    message="No data found based on given parameters. Please adjust your parameters and try again",
                 )
 
-            if command["name"] == "unhandled":
-                messages = consult_message.unhandled_messages()
+                return response.send_to(recipients())
 
-                return consult_message.generate_csv(
-                    messages, f"unhandled_consults_{current_time}.csv"
-                )
+            agents = "\n".join(
+                f"\t• <@{agent_id}>: {count}"
+                for agent_id, count in stats["agents"].items()
+            )
 
-            if command["name"] == "with-ping-word":
-                messages = consult_message.messages_with_ping_word()
+            response = SlackResponse(
+                channel_id=config["channel_id"],
+                slack_user_id=slack_user_id,
+                message=f"*Consults from {date_range['oldest_date']} to {date_range['latest_date']}:*\n\t• all: {stats['total']}\n\t• handled: {stats['handled']}\n\t• unhandled: {stats['unhandled']}\n\t• with ping word: {stats['with_ping_word']}\n\t• invalid: {stats['invalid']}\n\t• no research: {stats['no_research']}"
+                + (f"\n*Handled per agent:*\n{agents}" if agents else ""),
+            )
 
-                return consult_message.generate_csv(
-                    messages, f"consults_with_ping_word_{current_time}.csv"
-                )
+            return response.send_to(recipients())
 
-        if len(date_time_list) == 1:
+        if command["name"] == "latency":
             consult_message = ConsultMessage(
-                config,
-                oldest_date=f"{date_time_list[0]['date']},{date_time_list[0]['time'] or '00:00'}{date_time_list[0]['time_zone'] or '+0000'}",
-                latest_date=f"{date_time_list[0]['date']},{date_time_list[0]['time'] or '23:59:59'}{date_time_list[0]['time_zone'] or '+0000'}",
-                utc_offset=date_time_list[0]["time_zone"] or "+0000",
-                slack_user_id=slack_user_id,
+                config, slack_user_id=slack_user_id, **date_range
+            )
+            latency = consult_message.generate_latency_report(
+                f"consult_latency_{current_time}.{report_format}"
             )
 
-            report = check_argument_and_create_csv()
-
-            if report["is_empty"]:
+            if latency["report"]["is_empty"] or (latency["channel"]["count"] == 0):
                 response = SlackResponse(
                     channel_id=config["channel_id"],
                     slack_user_id=slack_user_id,
@@ -141,30 +267,110 @@ def _report_command_background_task(
                     message="No data found based on given parameters. Please adjust your parameters and try again",
                 )
 
-                return response.send()
+                return response.send_to(recipients())
+
+            agents = "\n".join(
+                f"\t• <@{agent_id}>: {_format_latency(summary)}"
+                for agent_id, summary in sorted(
+                    latency["agents"].items(), key=lambda item: -item[1]["count"]
+                )
+            )
 
             response = SlackResponse(
                 channel_id=config["channel_id"],
                 slack_user_id=slack_user_id,
-                message=f"Your report is ready, download it by clicking <{report['url']}|this link>",
+                message=f"*Time to first agent reply:*\n\t• <#{config['channel_id']}>: {_format_latency(latency['channel'])}"
+                + (f"\n*Per handling agent:*\n{agents}" if agents else "")
+                + f"\nPer-consult latencies: <{latency['report']['url']}|download>",
             )
 
-            return response.send()
+            return response.send_to(recipients())
 
-        if len(date_time_list) == 2:
+        if command["name"] == "audit":
+            # Only channels where the requester is a consult agent are
+            # included, so the audit cannot expose other channels' consults.
+            audit_configs = [
+                channel_config
+                for channel_config in channel_configs.configured()
+                if slack_user_id in channel_config.agent_ids
+            ]
+
+            if not audit_configs:
+                response = SlackResponse(
+                    channel_id=config["channel_id"],
+                    slack_user_id=slack_user_id,
+                    status=":x: Failed request - forbidden",
+                    message="The audit report only covers channels where you are a consult agent, and you are not one in any configured channel.",
+                )
+
+                return response.send_to(recipients())
+
+            channels = [
+                (
+                    channel_config,
+                    ConsultMessage(
+                        channel_config, slack_user_id=slack_user_id, **date_range
+                    ),
+                )
+                for channel_config in audit_configs
+            ]
+            prefixes = {"all": "audit_consults"}
+            file_names = _get_report_file_names(
+                prefixes, channels, range_key, report_format
+            )
+            report = (
+                (report_cache.lookup(config["channel_id"], file_names) or {}).get("all")
+                if file_names
+                else None
+            )
+
+            # Channels that are not fully synced yet are fetched in parallel
+            # by the merge, and the report is named once they all are.
+            if report is None:
+                report = generate_merged_csv(
+                    [consult_message for _, consult_message in channels],
+                    "all",
+                    config["channel_id"],
+                    (
+                        file_names
+                        or _get_temporary_file_names(
+                            prefixes, report_format, current_time
+                        )
+                    )["all"],
+                    lambda: (
+                        _get_report_file_names(
+                            prefixes, channels, range_key, report_format
+                        )
+                        or {}
+                    ).get("all"),
+                )
+
+        elif command["name"] == "bundle":
             consult_message = ConsultMessage(
-                config,
-                oldest_date=f"{date_time_list[0]['date']},{date_time_list[0]['time'] or '00:00'}{date_time_list[0]['time_zone'] or '+0000'}",
-                latest_date=f"{date_time_list[1]['date']},{date_time_list[1]['time'] or '23:59:59'}{date_time_list[1]['time_zone'] or '+0000'}",
-                utc_offset=date_time_list[0]["time_zone"]
-                or date_time_list[1]["time_zone"]
-                or "+0000",
-                slack_user_id=slack_user_id,
+                config, slack_user_id=slack_user_id, **date_range
+            )
+            channels = [(config, consult_message)]
+            file_names = _get_report_file_names(
+                report_file_prefixes, channels, range_key, report_format
+            )
+            reports = (
+                report_cache.lookup(config["channel_id"], file_names)
+                if file_names
+                else None
             )
 
-            report = check_argument_and_create_csv()
+            if reports is None:
+                reports = consult_message.generate_reports(
+                    file_names
+                    or _get_temporary_file_names(
+                        report_file_prefixes, report_format, current_time
+                    ),
+                    lambda: _get_report_file_names(
+                        report_file_prefixes, channels, range_key, report_format
+                    ),
+                )
 
-            if report["is_empty"]:
+            if reports["all"]["is_empty"]:
                 response = SlackResponse(
                     channel_id=config["channel_id"],
                     slack_user_id=slack_user_id,
@@ -172,15 +378,73 @@ def _report_command_background_task(
                     message="No data found based on given parameters. Please adjust your parameters and try again",
                 )
 
-                return response.send()
+                return response.send_to(recipients())
+
+            links = "\n".join(
+                (
+                    f"\t• {name}: <{report['url']}|download>"
+                    if not report["is_empty"]
+                    else f"\t• {name}: no data"
+                )
+                for name, report in reports.items()
+            )
 
             response = SlackResponse(
                 channel_id=config["channel_id"],
                 slack_user_id=slack_user_id,
-                message=f"Your report is ready, download it by clicking <{report['url']}|this link>",
+                message=f"Your reports are ready:\n{links}",
             )
 
-            return response.send()
+            return response.send_to(recipients())
+
+        else:
+            consult_message = ConsultMessage(
+                config, slack_user_id=slack_user_id, **date_range
+            )
+            channels = [(config, consult_message)]
+            prefixes = {command["name"]: report_file_prefixes[command["name"]]}
+            file_names = _get_report_file_names(
+                prefixes, channels, range_key, report_format
+            )
+            report = (
+                (report_cache.lookup(config["channel_id"], file_names) or {}).get(
+                    command["name"]
+                )
+                if file_names
+                else None
+            )
+
+            if report is None:
+                report = consult_message.generate_csv(
+                    command["name"],
+                    (
+                        file_names
+                        or _get_temporary_file_names(
+                            prefixes, report_format, current_time
+                        )
+                    )[command["name"]],
+                    lambda: _get_report_file_names(
+                        prefixes, channels, range_key, report_format
+                    ),
+                )
+
+        if report["is_empty"]:
+            response = SlackResponse(
+                channel_id=config["channel_id"],
+                slack_user_id=slack_user_id,
+                status=":question: Failed request - not found",
+                message="No data found based on given parameters. Please adjust your parameters and try again",
+            )
+
+            return response.send_to(recipients())
+
+        response = SlackResponse(
+            channel_id=config["channel_id"],
+            slack_user_id=slack_user_id,
+            message=f"Your report is ready, download it by clicking <{report['url']}|this link>",
+        )
+
+        return response.send_to(recipients())
 
     except ValueError:
         logging.exception(f"Exception occured while converting date to timestamp")
@@ -192,7 +456,7 @@ def _report_command_background_task(
             message="Unsupported date format. To view accepted date formats use: /consults formats",
         )
 
-        response.send()
+        response.send_to(recipients())
 
     except Exception:
         logging.exception(f"Exception during run_command")
@@ -204,7 +468,7 @@ def _report_command_background_task(
             message="Something went awry!",
         )
 
-        response.send()
+        response.send_to(recipients())
 
 
 def _config_command_background_task(
@@ -253,76 +517,56 @@ def _config_command_background_task(
             response.set_custom_message_blocks(blocks)
             return response.send()
 
-        if not os.path.isdir(f"./channels/{slack_channel_id}"):
-            os.mkdir(f"./channels/{slack_channel_id}")
-            os.mkdir(f"./channels/{slack_channel_id}/reports")
-
-        if not os.path.isfile(f"./channels/{slack_channel_id}/config.json"):
-            new_file = open(f"channels/{slack_channel_id}/config.json", "w")
-
-            data = {
-                "channel_id": slack_channel_id,
-                "channel_ping_words": [],
-                "consult_agent_ids": [],
-                "reaction_for_handling": None,
-                "reaction_for_invalid": None,
-                "reaction_for_no_research": None,
-            }
-
-            json.dump(data, new_file, indent=4)
-            new_file.close()
-
-        with open(f"channels/{slack_channel_id}/config.json", "r") as config_file:
-            config_as_dict: Dict = json.load(config_file)
+        default_config = {
+            "channel_id": slack_channel_id,
+            "channel_ping_words": [],
+            "consult_agent_ids": [],
+            "reaction_for_handling": None,
+            "reaction_for_invalid": None,
+            "reaction_for_no_research": None,
+        }
 
         if command["name"] == "get":
+            config = channel_configs.get_or_create(slack_channel_id, default_config)
+
             response = SlackResponse(
                 channel_id=slack_channel_id,
                 slack_user_id=slack_user_id,
-                message=json.dumps(config_as_dict, indent=4),
+                message=json.dumps(config, indent=4),
             )
 
             return response.send()
 
         if command["name"] == "delete":
             if "channel_ping_words" in command["args"]:
-                values = command["args"]["channel_ping_words"]
-
-                for v in values:
-                    try:
-                        config_as_dict["channel_ping_words"].remove(v)
-                    except ValueError:
-                        logging.exception(f"Exception during run_command")
-
-                        response = SlackResponse(
-                            channel_id=slack_channel_id,
-                            slack_user_id=slack_user_id,
-                            status=":question: Failed request - not found",
-                            message=f"No such ping word: {v}",
-                        )
-
-                        return response.send()
+                key = "channel_ping_words"
+                not_found_message = "No such ping word"
 
             elif "consult_agent_ids" in command["args"]:
-                values = command["args"]["consult_agent_ids"]
-
-                for v in values:
-                    try:
-                        config_as_dict["consult_agent_ids"].remove(v)
-                    except ValueError:
-                        logging.exception(f"Exception during run_command")
-
-                        response = SlackResponse(
-                            channel_id=slack_channel_id,
-                            slack_user_id=slack_user_id,
-                            status=":question: Failed request - not found",
-                            message=f"No such user ID: {v}",
-                        )
+                key = "consult_agent_ids"
+                not_found_message = "No such user ID"
 
-                        return response.send()
+            def delete_values(config_as_dict: Dict) -> None:
+                for v in command["args"][key]:
+                    if v not in config_as_dict[key]:
+                        raise LookupError(v)
 
-            with open(f"channels/{slack_channel_id}/config.json", "w") as config_file:
-                json.dump(config_as_dict, config_file, indent=4)
+                    config_as_dict[key].remove(v)
+
+            try:
+                channel_configs.update(slack_channel_id, delete_values, default_config)
+
+            except LookupError as e:
+                logging.exception(f"Exception during run_command")
+
+                response = SlackResponse(
+                    channel_id=slack_channel_id,
+                    slack_user_id=slack_user_id,
+                    status=":question: Failed request - not found",
+                    message=f"{not_found_message}: {e.args[0]}",
+                )
+
+                return response.send()
 
             response = SlackResponse(
                 channel_id=slack_channel_id,
@@ -333,41 +577,42 @@ def _config_command_background_task(
             return response.send()
 
         if command["name"] == "set":
-            if "channel_ping_words" in command["args"]:
-                values = command["args"]["channel_ping_words"]
-                for v in values:
-                    config_as_dict["channel_ping_words"].append(v)
-
-            if "consult_agent_ids" in command["args"]:
-                values = command["args"]["consult_agent_ids"]
-                for v in values:
-                    config_as_dict["consult_agent_ids"].append(v)
-
-            if "reaction_for_handling" in command["args"]:
-                config_as_dict["reaction_for_handling"] = command["args"][
-                    "reaction_for_handling"
-                ]
 
-            if "reaction_for_invalid" in command["args"]:
-                config_as_dict["reaction_for_invalid"] = command["args"][
-                    "reaction_for_invalid"
-                ]
-
-            if "reaction_for_no_research" in command["args"]:
-                config_as_dict["reaction_for_no_research"] = command["args"][
-                    "reaction_for_no_research"
-                ]
-
-            with open(f"channels/{slack_channel_id}/config.json", "w") as config_file:
-                json.dump(config_as_dict, config_file, indent=4)
-
-            config = check_config(slack_channel_id)
+            def set_values(config_as_dict: Dict) -> None:
+                if "channel_ping_words" in command["args"]:
+                    values = command["args"]["channel_ping_words"]
+                    for v in values:
+                        config_as_dict["channel_ping_words"].append(v)
+
+                if "consult_agent_ids" in command["args"]:
+                    values = command["args"]["consult_agent_ids"]
+                    for v in values:
+                        config_as_dict["consult_agent_ids"].append(v)
+
+                if "reaction_for_handling" in command["args"]:
+                    config_as_dict["reaction_for_handling"] = command["args"][
+                        "reaction_for_handling"
+                    ]
+
+                if "reaction_for_invalid" in command["args"]:
+                    config_as_dict["reaction_for_invalid"] = command["args"][
+                        "reaction_for_invalid"
+                    ]
+
+                if "reaction_for_no_research" in command["args"]:
+                    config_as_dict["reaction_for_no_research"] = command["args"][
+                        "reaction_for_no_research"
+                    ]
+
+            config = channel_configs.update(
+                slack_channel_id, set_values, default_config
+            )
 
-            if config["empty_keys"]:
+            if config.empty_keys:
                 response = SlackResponse(
                     channel_id=slack_channel_id,
                     slack_user_id=slack_user_id,
-                    message=f"Properties left to configure: {', '.join(config['empty_keys'])}",
+                    message=f"Properties left to configure: {', '.join(config.empty_keys)}",
                 )
 
                 return response.send()
@@ -1,81 +1,314 @@
 import csv
-import flatdict
 import os
+import gzip
+import json
+import heapq
+from collections import defaultdict
+from contextlib import ExitStack, closing
+from datetime import datetime
 from dotenv import load_dotenv, find_dotenv
-from typing import List, Dict
+from typing import Any, Callable, Dict, Iterator, List, Optional, TextIO, Tuple
 
 from base_message import BaseMessage
+from consult_record import ConsultRecord
+from metrics import percentile_summary
+from report_cache import empty_marker, report_url
+
+csv_fields = [
+    "created",
+    "has_ping_word",
+    "is_handled",
+    "handled_by:name",
+    "handled_by:email",
+    "topic",
+    "research",
+    "slack_link",
+]
+
+views = {
+    "all": lambda message: True,
+    "handled": lambda message: message.is_handled,
+    "unhandled": lambda message: not message.is_handled,
+    "with-ping-word": lambda message: message.has_ping_word,
+}
+
+merged_csv_fields = ["channel_id"] + csv_fields
+
+latency_csv_fields = [
+    "created",
+    "handled_by:name",
+    "handled_by:email",
+    "first_agent_reply_seconds",
+    "handling_agent_reply_seconds",
+    "slack_link",
+]
+
+flush_interval = 100
+
+load_dotenv(find_dotenv())
+
+gzip_level = int(os.environ.get("REPORT_GZIP_LEVEL") or 6)
+
+
+class JsonLinesWriter:
+    def __init__(self, output_file: TextIO, fields: List[str]) -> None:
+        self._output_file = output_file
+        self._fields = fields
+
+    def writerow(self, row: List) -> None:
+        self._output_file.write(
+            json.dumps(dict(zip(self._fields, row)), separators=(",", ":"))
+        )
+        self._output_file.write("\n")
 
 
 class ConsultMessage(BaseMessage):
-    def all_messages(self) -> List:
-        return self._channel_messages
+    def generate_csv(
+        self,
+        view: str,
+        file_name: str,
+        final_file_names: Optional[Callable[[], Optional[Dict[str, str]]]] = None,
+    ) -> Dict:
+        return self.generate_reports({view: file_name}, final_file_names)[view]
 
-    def messages_with_ping_word(self) -> List:
-        messages_with_ping_word = []
+    def generate_reports(
+        self,
+        file_names: Dict[str, str],
+        final_file_names: Optional[Callable[[], Optional[Dict[str, str]]]] = None,
+    ) -> Dict[str, Dict]:
+        reports_dir = f"./channels/{self._config['channel_id']}/reports"
 
-        for message in self._channel_messages:
-            if message["has_ping_word"]:
-                messages_with_ping_word.append(message)
+        if not os.path.isdir(reports_dir):
+            os.mkdir(reports_dir)
 
-        return messages_with_ping_word
+        outputs = {}
 
-    def handled_messages(self) -> List:
-        handled_messages = []
+        try:
+            with ExitStack() as stack:
+                for view, file_name in file_names.items():
+                    output_file, writer = _open_report(
+                        stack, reports_dir, file_name, csv_fields
+                    )
 
-        for message in self._channel_messages:
-            if message["is_handled"]:
-                handled_messages.append(message)
+                    outputs[view] = {"file": output_file, "writer": writer, "rows": 0}
 
-        return handled_messages
+                for count, message in enumerate(self.iter_consult_messages(), 1):
+                    row = None
 
-    def unhandled_messages(self) -> List:
-        unhandled_messages = []
+                    for view, output in outputs.items():
+                        if views[view](message):
+                            row = row or self._to_csv_row(message)
+                            output["writer"].writerow(row)
+                            output["rows"] += 1
 
-        for message in self._channel_messages:
-            if not message["is_handled"]:
-                unhandled_messages.append(message)
+                    if count % flush_interval == 0:
+                        for output in outputs.values():
+                            if output["file"]:
+                                output["file"].flush()
 
-        return unhandled_messages
+            # Reports are written while the range is being fetched, and can
+            # only be named after the store revision once the fetch is done.
+            report_names = (final_file_names and final_file_names()) or file_names
 
-    def generate_csv(self, consult_messages: List[Dict], file_name: str):
-        load_dotenv(find_dotenv())
+        except Exception:
+            for file_name in file_names.values():
+                if os.path.isfile(f"{reports_dir}/.{file_name}.tmp"):
+                    os.remove(f"{reports_dir}/.{file_name}.tmp")
 
-        domain = os.environ["DOMAIN"]
+            raise
 
-        if len(consult_messages) == 0:
-            return {"is_empty": True}
+        return {
+            view: _finish_report(
+                reports_dir,
+                file_name,
+                outputs[view]["rows"],
+                self._config["channel_id"],
+                report_names[view],
+            )
+            for view, file_name in file_names.items()
+        }
 
-        if not os.path.isdir(f"./channels/{self._config['channel_id']}/reports"):
-            os.mkdir(f"./channels/{self._config['channel_id']}/reports")
+    def generate_latency_report(self, file_name: str) -> Dict:
+        reports_dir = f"./channels/{self._config['channel_id']}/reports"
 
-        with open(
-            f"./channels/{self._config['channel_id']}/reports/{file_name}",
-            "w",
-            newline="",
-        ) as output_file:
-            fields = [
-                "created",
-                "has_ping_word",
-                "is_handled",
-                "handled_by:name",
-                "handled_by:email",
-                "topic",
-                "research",
-                "slack_link",
-            ]
+        if not os.path.isdir(reports_dir):
+            os.mkdir(reports_dir)
 
-            writer = csv.DictWriter(output_file, fields, extrasaction="ignore")
-            writer.writeheader()
-            for message in consult_messages:
-                row = flatdict.FlatDict(message)
-                writer.writerow(row)
+        channel_latencies = []
+        agent_latencies = defaultdict(list)
+        rows = 0
 
-        file_path = f"channels/{self._config['channel_id']}/reports/{file_name}"
-        url = f"https://{domain}/{file_path}"
+        try:
+            with ExitStack() as stack:
+                _, writer = _open_report(
+                    stack, reports_dir, file_name, latency_csv_fields
+                )
+
+                for (
+                    consult_message,
+                    first_reply,
+                    handler_reply,
+                ) in self.iter_handling_latencies():
+                    created, _, _, name, email, _, _, slack_link = self._to_csv_row(
+                        consult_message
+                    )
+
+                    writer.writerow(
+                        [
+                            created,
+                            name,
+                            email,
+                            _round_seconds(first_reply),
+                            _round_seconds(handler_reply),
+                            slack_link,
+                        ]
+                    )
+                    rows += 1
+
+                    if first_reply is not None:
+                        channel_latencies.append(first_reply)
+
+                    if handler_reply is not None:
+                        agent_latencies[consult_message.agent_id].append(handler_reply)
+
+        except Exception:
+            if os.path.isfile(f"{reports_dir}/.{file_name}.tmp"):
+                os.remove(f"{reports_dir}/.{file_name}.tmp")
+
+            raise
 
         return {
-            "is_empty": False,
-            "file_name": file_name,
-            "url": url,
+            "report": _finish_report(
+                reports_dir, file_name, rows, self._config["channel_id"]
+            ),
+            "channel": percentile_summary(channel_latencies),
+            "agents": {
+                agent_id: percentile_summary(latencies)
+                for agent_id, latencies in agent_latencies.items()
+            },
         }
+
+    def to_merged_csv_row(self, consult_message: ConsultRecord) -> List:
+        return [self._config["channel_id"]] + self._to_csv_row(consult_message)
+
+    def _to_csv_row(self, consult_message: ConsultRecord) -> List:
+        handled_by = consult_message.handled_by or {}
+
+        return [
+            datetime.fromtimestamp(consult_message.ts, self._tz_info).strftime(
+                "%d/%m/%Y %H:%M:%S %Z"
+            ),
+            consult_message.has_ping_word,
+            consult_message.is_handled,
+            handled_by.get("name"),
+            handled_by.get("email"),
+            consult_message.topic,
+            consult_message.research,
+            self._slack_link_prefix + f"{consult_message.ts:.6f}".replace(".", ""),
+        ]
+
+
+def generate_merged_csv(
+    consult_messages: List[ConsultMessage],
+    view: str,
+    slack_channel_id: str,
+    file_name: str,
+    final_file_name: Optional[Callable[[], Optional[str]]] = None,
+) -> Dict:
+    reports_dir = f"./channels/{slack_channel_id}/reports"
+
+    if not os.path.isdir(reports_dir):
+        os.mkdir(reports_dir)
+
+    rows = 0
+
+    try:
+        with ExitStack() as stack:
+            _, writer = _open_report(stack, reports_dir, file_name, merged_csv_fields)
+
+            # Every channel streams its records newest first, and each one
+            # fetches its history in the background as soon as the merge
+            # first asks it for a record, so channels are read in parallel.
+            channel_records = [
+                stack.enter_context(closing(_iter_view_records(consult_message, view)))
+                for consult_message in consult_messages
+            ]
+
+            for consult_message, record in heapq.merge(
+                *channel_records, key=lambda item: item[1].ts, reverse=True
+            ):
+                writer.writerow(consult_message.to_merged_csv_row(record))
+                rows += 1
+
+        report_name = (final_file_name and final_file_name()) or file_name
+
+    except Exception:
+        if os.path.isfile(f"{reports_dir}/.{file_name}.tmp"):
+            os.remove(f"{reports_dir}/.{file_name}.tmp")
+
+        raise
+
+    return _finish_report(reports_dir, file_name, rows, slack_channel_id, report_name)
+
+
+def _iter_view_records(
+    consult_message: ConsultMessage, view: str
+) -> Iterator[Tuple[ConsultMessage, ConsultRecord]]:
+    for record in consult_message.iter_consult_messages():
+        if views[view](record):
+            yield consult_message, record
+
+
+def _finish_report(
+    reports_dir: str,
+    file_name: str,
+    rows: int,
+    slack_channel_id: str,
+    report_name: Optional[str] = None,
+) -> Dict:
+    report_name = report_name or file_name
+
+    if rows == 0:
+        os.replace(
+            f"{reports_dir}/.{file_name}.tmp",
+            f"{reports_dir}/{empty_marker(report_name)}",
+        )
+
+        return {"is_empty": True}
+
+    os.replace(f"{reports_dir}/.{file_name}.tmp", f"{reports_dir}/{report_name}")
+
+    return {
+        "is_empty": False,
+        "file_name": report_name,
+        "url": report_url(slack_channel_id, report_name),
+    }
+
+
+def _round_seconds(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds, 3) if seconds is not None else None
+
+
+def _open_report(
+    stack: ExitStack, reports_dir: str, file_name: str, fields: List[str]
+) -> Tuple[Optional[TextIO], Any]:
+    temp_path = f"{reports_dir}/.{file_name}.tmp"
+
+    # Compressed reports are not flushed periodically, because every flush
+    # ends a deflate block and makes the output larger.
+    if file_name.endswith(".gz"):
+        output_file = stack.enter_context(
+            gzip.open(temp_path, "wt", newline="", compresslevel=gzip_level)
+        )
+        flushed_file = None
+    else:
+        output_file = stack.enter_context(open(temp_path, "w", newline=""))
+        flushed_file = output_file
+
+    if file_name.endswith((".jsonl", ".jsonl.gz")):
+        return flushed_file, JsonLinesWriter(output_file, fields)
+
+    writer = csv.writer(output_file)
+    writer.writerow(fields)
+
+    return flushed_file, writer
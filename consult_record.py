@@ -0,0 +1,94 @@
+from typing import Dict, Optional
+
+from channel_config import ChannelConfig
+
+ignore_subtypes = [
+    "bot_message",
+    "me_message",
+    "channel_join",
+    "channel_leave",
+    "channel_topic",
+    "channel_purpose",
+    "channel_name",
+    "channel_archive",
+    "channel_unarchive",
+    "file_share",
+    "channel_posting_permissions",
+]
+
+
+class ConsultRecord:
+    __slots__ = (
+        "ts",
+        "has_ping_word",
+        "is_handled",
+        "topic",
+        "research",
+        "agent_id",
+        "handled_by",
+    )
+
+    def __init__(self, ts: float) -> None:
+        self.ts = ts
+        self.has_ping_word = False
+        self.is_handled = False
+        self.topic: Optional[str] = None
+        self.research: Optional[str] = None
+        self.agent_id: Optional[str] = None
+        self.handled_by: Optional[Dict] = None
+
+
+class ConsultClassifier:
+    # The report views and the per-day counters both classify messages here,
+    # so a consult is counted as handled exactly when it is listed as handled.
+    def __init__(self, config: ChannelConfig) -> None:
+        self._reaction_for_handling = config["reaction_for_handling"]
+        self._reaction_for_invalid = config["reaction_for_invalid"]
+        self._reaction_for_no_research = config["reaction_for_no_research"]
+        self._ping_word_matcher = config.ping_word_matcher
+        self._agent_ids = config.agent_ids
+
+    def classify(self, slack_message: Dict) -> ConsultRecord:
+        consult_message = ConsultRecord(float(slack_message["ts"]))
+
+        if self._ping_word_matcher and self._ping_word_matcher(
+            "".join(slack_message.get("text", "").split()).lower()
+        ):
+            consult_message.has_ping_word = True
+
+        if ("reactions" in slack_message) and ("reply_users" in slack_message):
+            reactions = {
+                reaction["name"]: reaction for reaction in slack_message["reactions"]
+            }
+
+            if self._reaction_for_handling in reactions:
+                consult_message.agent_id = self._handling_agent(
+                    slack_message, reactions[self._reaction_for_handling]
+                )
+
+                if consult_message.agent_id is not None:
+                    consult_message.topic = "valid"
+                    consult_message.research = "provided"
+                    consult_message.is_handled = True
+
+                if self._reaction_for_invalid in reactions:
+                    consult_message.topic = "invalid"
+
+                if self._reaction_for_no_research in reactions:
+                    consult_message.research = "none"
+
+        return consult_message
+
+    def _handling_agent(
+        self, slack_message: Dict, handling_reaction: Dict
+    ) -> Optional[str]:
+        reply_users = set(slack_message["reply_users"])
+
+        for reaction_user in handling_reaction["users"]:
+            if reaction_user == slack_message.get("user"):
+                break
+
+            if (reaction_user in reply_users) and (reaction_user in self._agent_ids):
+                return reaction_user
+
+        return None
@@ -0,0 +1,280 @@
+import json
+import math
+import sqlite3
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from channel_config import channel_configs
+from consult_record import ConsultClassifier, ConsultRecord, ignore_subtypes
+
+schema = """
+CREATE TABLE IF NOT EXISTS message_stats (
+    ts TEXT PRIMARY KEY,
+    ts_value REAL NOT NULL,
+    day TEXT NOT NULL,
+    has_ping_word INTEGER NOT NULL,
+    is_handled INTEGER NOT NULL,
+    is_invalid INTEGER NOT NULL,
+    no_research INTEGER NOT NULL,
+    handled_by TEXT
+);
+CREATE INDEX IF NOT EXISTS message_stats_ts_value ON message_stats (ts_value);
+CREATE TABLE IF NOT EXISTS daily_stats (
+    day TEXT PRIMARY KEY,
+    total INTEGER NOT NULL,
+    handled INTEGER NOT NULL,
+    with_ping_word INTEGER NOT NULL,
+    invalid INTEGER NOT NULL,
+    no_research INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS daily_agent_stats (
+    day TEXT NOT NULL,
+    agent_id TEXT NOT NULL,
+    handled INTEGER NOT NULL,
+    PRIMARY KEY (day, agent_id)
+);
+CREATE TABLE IF NOT EXISTS stats_version (
+    config_version INTEGER
+);
+"""
+
+Classification = Tuple[float, str, int, int, int, int, Optional[str]]
+
+day_seconds = 86400
+
+
+def classify_message(
+    message: Dict,
+    classifier: ConsultClassifier,
+    consult_message: Optional[ConsultRecord] = None,
+) -> Optional[Classification]:
+    if message.get("subtype") in ignore_subtypes:
+        return None
+
+    if consult_message is None:
+        consult_message = classifier.classify(message)
+
+    return (
+        consult_message.ts,
+        _day(consult_message.ts),
+        int(consult_message.has_ping_word),
+        int(consult_message.is_handled),
+        int(consult_message.topic == "invalid"),
+        int(consult_message.research == "none"),
+        consult_message.agent_id,
+    )
+
+
+class ConsultStats:
+    def __init__(self, connection: sqlite3.Connection, slack_channel_id: str) -> None:
+        self._connection = connection
+        self._slack_channel_id = slack_channel_id
+        self._loaded = False
+        self._version = None
+        self._classifier: Optional[ConsultClassifier] = None
+
+        self._connection.executescript(schema)
+
+    def update(
+        self,
+        messages: List[Dict],
+        consult_messages: Optional[Dict[str, ConsultRecord]] = None,
+        config_version: Optional[int] = None,
+    ) -> None:
+        if not self._is_current():
+            return
+
+        # Records the report already classified are reused when they were
+        # classified with the same config version.
+        if (consult_messages is None) or (config_version != self._version):
+            consult_messages = {}
+
+        for message in messages:
+            self._apply(
+                message["ts"],
+                classify_message(
+                    message, self._classifier, consult_messages.get(message["ts"])
+                ),
+            )
+
+    def remove(self, ts: str) -> None:
+        if self._is_current():
+            self._apply(ts, None)
+
+    def summary(self, oldest: float, latest: float) -> Dict:
+        # Whole UTC days inside the range are read from the daily counters and
+        # the partial days at its edges from the per-message rows, so the
+        # totals match the requested range exactly. Ranges are half-open.
+        with self._connection:
+            if not self._is_current():
+                self._rebuild()
+
+        latest = math.nextafter(latest, math.inf)
+        first_day = math.ceil(oldest / day_seconds) * day_seconds
+        last_day = math.floor(latest / day_seconds) * day_seconds
+        totals = [0, 0, 0, 0, 0]
+        agents: Dict[str, int] = {}
+
+        if first_day < last_day:
+            self._add_counts(
+                totals,
+                agents,
+                "SELECT SUM(total), SUM(handled), SUM(with_ping_word), SUM(invalid), SUM(no_research) FROM daily_stats WHERE day >= ? AND day < ?",
+                "SELECT agent_id, SUM(handled) FROM daily_agent_stats WHERE day >= ? AND day < ? GROUP BY agent_id",
+                (_day(first_day), _day(last_day)),
+            )
+            edges = [(oldest, first_day), (last_day, latest)]
+
+        else:
+            edges = [(oldest, latest)]
+
+        for edge in edges:
+            self._add_counts(
+                totals,
+                agents,
+                "SELECT COUNT(*), SUM(is_handled), SUM(has_ping_word), SUM(is_invalid), SUM(no_research) FROM message_stats WHERE ts_value >= ? AND ts_value < ?",
+                "SELECT handled_by, COUNT(*) FROM message_stats WHERE ts_value >= ? AND ts_value < ? AND handled_by IS NOT NULL GROUP BY handled_by",
+                edge,
+            )
+
+        total, handled, with_ping_word, invalid, no_research = totals
+
+        return {
+            "total": total,
+            "handled": handled,
+            "unhandled": total - handled,
+            "with_ping_word": with_ping_word,
+            "invalid": invalid,
+            "no_research": no_research,
+            "agents": {
+                agent_id: count
+                for agent_id, count in sorted(
+                    agents.items(), key=lambda agent: (-agent[1], agent[0])
+                )
+                if count > 0
+            },
+        }
+
+    def _add_counts(
+        self,
+        totals: List[int],
+        agents: Dict[str, int],
+        totals_query: str,
+        agents_query: str,
+        params: Tuple,
+    ) -> None:
+        row = self._connection.execute(totals_query, params).fetchone()
+
+        for index, value in enumerate(row):
+            totals[index] += value or 0
+
+        for agent_id, count in self._connection.execute(agents_query, params):
+            agents[agent_id] = agents.get(agent_id, 0) + count
+
+    def _is_current(self) -> bool:
+        row = self._connection.execute(
+            "SELECT config_version FROM stats_version"
+        ).fetchone()
+
+        # The config is only loaded when the counters are first used, and
+        # again whenever the cached config has been replaced by a newer one.
+        config = channel_configs.get(self._slack_channel_id)
+        version = config.version if config is not None else None
+
+        if (not self._loaded) or (version != self._version):
+            self._loaded = True
+            self._version = version
+            self._classifier = ConsultClassifier(config) if config is not None else None
+
+        # The stats tables are created together with the message store, so
+        # they start out current for the config version loaded here.
+        if row is None:
+            self._rebuild()
+            row = (self._version,)
+
+        # Counters classified with another config version are left stale and
+        # only rebuilt by the next summary, so no event or report write pays
+        # for reclassifying the whole store.
+        return (self._classifier is not None) and (row[0] == self._version)
+
+    def _rebuild(self) -> None:
+        for table in ("message_stats", "daily_stats", "daily_agent_stats"):
+            self._connection.execute(f"DELETE FROM {table}")
+
+        self._connection.execute("DELETE FROM stats_version")
+        self._connection.execute(
+            "INSERT INTO stats_version (config_version) VALUES (?)", (self._version,)
+        )
+
+        if self._classifier is None:
+            return
+
+        rows = []
+
+        for ts, message in self._connection.execute("SELECT ts, message FROM messages"):
+            classification = classify_message(json.loads(message), self._classifier)
+
+            if classification is not None:
+                rows.append((ts, *classification))
+
+        self._connection.executemany(
+            "INSERT INTO message_stats (ts, ts_value, day, has_ping_word, is_handled, is_invalid, no_research, handled_by) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        self._connection.execute(
+            "INSERT INTO daily_stats (day, total, handled, with_ping_word, invalid, no_research) SELECT day, COUNT(*), SUM(is_handled), SUM(has_ping_word), SUM(is_invalid), SUM(no_research) FROM message_stats GROUP BY day"
+        )
+        self._connection.execute(
+            "INSERT INTO daily_agent_stats (day, agent_id, handled) SELECT day, handled_by, COUNT(*) FROM message_stats WHERE handled_by IS NOT NULL GROUP BY day, handled_by"
+        )
+
+    def _apply(self, ts: str, classification: Optional[Classification]) -> None:
+        previous = self._connection.execute(
+            "SELECT ts_value, day, has_ping_word, is_handled, is_invalid, no_research, handled_by FROM message_stats WHERE ts = ?",
+            (ts,),
+        ).fetchone()
+
+        if previous == classification:
+            return
+
+        if previous is not None:
+            self._count(previous, -1)
+            self._connection.execute("DELETE FROM message_stats WHERE ts = ?", (ts,))
+
+        if classification is not None:
+            self._connection.execute(
+                "INSERT INTO message_stats (ts, ts_value, day, has_ping_word, is_handled, is_invalid, no_research, handled_by) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (ts, *classification),
+            )
+            self._count(classification, 1)
+
+    def _count(self, classification: Classification, sign: int) -> None:
+        _, day, has_ping_word, is_handled, is_invalid, no_research, handled_by = (
+            classification
+        )
+
+        self._connection.execute(
+            "INSERT INTO daily_stats (day, total, handled, with_ping_word, invalid, no_research) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (day) DO UPDATE SET total = total + excluded.total, handled = handled + excluded.handled, "
+            "with_ping_word = with_ping_word + excluded.with_ping_word, invalid = invalid + excluded.invalid, "
+            "no_research = no_research + excluded.no_research",
+            (
+                day,
+                sign,
+                sign * is_handled,
+                sign * has_ping_word,
+                sign * is_invalid,
+                sign * no_research,
+            ),
+        )
+
+        if handled_by is not None:
+            self._connection.execute(
+                "INSERT INTO daily_agent_stats (day, agent_id, handled) VALUES (?, ?, ?) "
+                "ON CONFLICT (day, agent_id) DO UPDATE SET handled = handled + excluded.handled",
+                (day, handled_by, sign),
+            )
+
+
+def _day(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%d")
@@ -0,0 +1,183 @@
+import logging
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, Optional
+
+from channel_config import channel_configs
+from message_store import MessageStore
+
+event_only_keys = ("channel", "channel_type", "event_ts")
+# Subtypes of message events that carry a message a user posted. Everything
+# else (message_replied, channel_join, bot messages, ...) is not a consult.
+stored_subtypes = (None, "thread_broadcast", "file_share")
+
+_channel_locks = defaultdict(threading.Lock)
+_lock = threading.Lock()
+
+
+def handle_event(payload: Dict) -> None:
+    if payload.get("type") != "event_callback":
+        return
+
+    event = payload.get("event") or {}
+    handler = event_handlers.get(event.get("type"))
+
+    if handler is None:
+        return
+
+    slack_channel_id = _event_channel(event)
+
+    # Only channels the bot has been configured for keep a message store.
+    if (slack_channel_id is None) or (channel_configs.get(slack_channel_id) is None):
+        return
+
+    with _lock:
+        channel_lock = _channel_locks[slack_channel_id]
+
+    with channel_lock:
+        message_store = MessageStore(slack_channel_id)
+
+        try:
+            handler(message_store, event)
+
+        finally:
+            message_store.close()
+
+
+def _event_channel(event: Dict) -> Optional[str]:
+    if event["type"] == "message":
+        return event.get("channel")
+
+    return (event.get("item") or {}).get("channel")
+
+
+def _on_message(message_store: MessageStore, event: Dict) -> None:
+    subtype = event.get("subtype")
+
+    if subtype == "message_deleted":
+        return message_store.delete_message(event["deleted_ts"])
+
+    if subtype == "message_changed":
+        message = event["message"]
+
+        if message.get("subtype") not in stored_subtypes:
+            return
+
+        # An edited thread reply is not a channel message, and editing it
+        # does not change who replied in the thread or when.
+        if (
+            ("thread_ts" in message)
+            and (message["thread_ts"] != message["ts"])
+            and (message.get("subtype") != "thread_broadcast")
+        ):
+            return
+
+        stored_message = message_store.get_message(message["ts"])
+
+        # Edit events carry the new text but not always the thread and
+        # reaction state, so keep what has been collected so far.
+        for key in ("reactions", "reply_users", "reply_count", "latest_reply"):
+            if stored_message and (key in stored_message) and (key not in message):
+                message[key] = stored_message[key]
+
+        return message_store.save_messages([message])
+
+    if event.get("hidden") or (subtype not in stored_subtypes):
+        return
+
+    message = {k: v for k, v in event.items() if k not in event_only_keys}
+
+    if ("thread_ts" in message) and (message["thread_ts"] != message["ts"]):
+        parent = message_store.get_message(message["thread_ts"])
+
+        if parent is not None:
+            reply_users = parent.setdefault("reply_users", [])
+            is_changed = False
+
+            if message.get("user") and (message["user"] not in reply_users):
+                reply_users.append(message["user"])
+                is_changed = True
+
+            # Cached thread replies are keyed by latest_reply, so it has to
+            # move forward for the thread to be fetched again.
+            if float(message["ts"]) > float(parent.get("latest_reply") or 0):
+                parent["latest_reply"] = message["ts"]
+                parent["reply_count"] = parent.get("reply_count", 0) + 1
+                is_changed = True
+
+            if is_changed:
+                message_store.save_messages([parent])
+
+        # Thread replies only appear in the channel history when they are
+        # also sent to the channel.
+        if subtype != "thread_broadcast":
+            return
+
+    message_store.save_messages([message])
+
+
+def _on_reaction_added(message_store: MessageStore, event: Dict) -> None:
+    message = _reacted_message(message_store, event)
+
+    if message is None:
+        return
+
+    reactions = message.setdefault("reactions", [])
+
+    for reaction in reactions:
+        if reaction["name"] == event["reaction"]:
+            break
+    else:
+        reaction = {"name": event["reaction"], "users": [], "count": 0}
+        reactions.append(reaction)
+
+    if event["user"] in reaction["users"]:
+        return
+
+    reaction["users"].append(event["user"])
+    reaction["count"] = len(reaction["users"])
+
+    message_store.save_messages([message])
+
+
+def _on_reaction_removed(message_store: MessageStore, event: Dict) -> None:
+    message = _reacted_message(message_store, event)
+
+    if message is None:
+        return
+
+    for reaction in message.get("reactions", []):
+        if (reaction["name"] == event["reaction"]) and (
+            event["user"] in reaction["users"]
+        ):
+            reaction["users"].remove(event["user"])
+            reaction["count"] = len(reaction["users"])
+
+            if not reaction["users"]:
+                message["reactions"].remove(reaction)
+
+            if not message["reactions"]:
+                del message["reactions"]
+
+            return message_store.save_messages([message])
+
+
+def _reacted_message(message_store: MessageStore, event: Dict) -> Optional[Dict]:
+    if event["item"].get("type") != "message":
+        return None
+
+    message = message_store.get_message(event["item"]["ts"])
+
+    if message is None:
+        logging.info(
+            f"Ignoring {event['type']} for unknown message {event['item']['ts']}"
+        )
+
+    return message
+
+
+event_handlers: Dict[str, Callable[[MessageStore, Dict], None]] = {
+    "message": _on_message,
+    "reaction_added": _on_reaction_added,
+    "reaction_removed": _on_reaction_removed,
+}
@@ -0,0 +1,266 @@
+import os
+import queue
+import asyncio
+import logging
+import threading
+import aiohttp
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv, find_dotenv
+from typing import Dict, Iterator, List, Optional, Tuple
+from slack_sdk.web.async_client import AsyncWebClient
+
+from slack_config import slack_client, slack_errors
+from slack_transport import (
+    max_rate_limit_retries,
+    rate_limit_bucket,
+    retry_after_seconds,
+)
+
+load_dotenv(find_dotenv())
+
+fetch_concurrency = int(os.environ.get("FETCH_CONCURRENCY") or 4)
+min_shard_seconds = float(os.environ.get("FETCH_MIN_SHARD_SECONDS") or 21600)
+page_buffer_size = int(os.environ.get("FETCH_PAGE_BUFFER") or 10)
+replies_concurrency = int(os.environ.get("REPLIES_CONCURRENCY") or 4)
+
+_done = object()
+
+
+class Shard:
+    def __init__(self, range_index: int, oldest: float, latest: float) -> None:
+        self.range_index = range_index
+        self.oldest = oldest
+        self.latest = latest
+        self.pages: queue.Queue = queue.Queue(maxsize=page_buffer_size)
+
+
+class HistoryFetcher:
+    def __init__(
+        self,
+        slack_channel_id: str,
+        ranges: List[Tuple[float, float]],
+        concurrency: int = fetch_concurrency,
+    ) -> None:
+        self._slack_channel_id = slack_channel_id
+        self._concurrency = max(1, concurrency)
+        self._shards = self._split(ranges)
+        self._stopped = threading.Event()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self) -> "HistoryFetcher":
+        if self._shards:
+            self._worker.start()
+
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._stopped.set()
+
+        if self._worker.is_alive():
+            self._worker.join()
+
+    def range_pages(self, range_index: int) -> Iterator[List[Dict]]:
+        for shard in self._shards:
+            if shard.range_index != range_index:
+                continue
+
+            while True:
+                page = shard.pages.get()
+
+                if page is _done:
+                    break
+
+                if isinstance(page, BaseException):
+                    raise page
+
+                yield page
+
+    def _run(self) -> None:
+        try:
+            asyncio.run(self._fetch_all())
+
+        except BaseException as e:
+            for shard in self._shards:
+                self._put(shard.pages, e)
+                self._put(shard.pages, _done)
+
+    async def _fetch_all(self) -> None:
+        semaphore = asyncio.Semaphore(self._concurrency)
+
+        # Every shard can be blocked on its full page queue at the same time,
+        # so each needs its own thread, or the shard being consumed could wait
+        # for a thread held by one that is not.
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=len(self._shards))
+        )
+
+        async with aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self._concurrency)
+        ) as session:
+            client = AsyncWebClient(token=slack_client.token, session=session)
+
+            await asyncio.gather(
+                *(self._fetch_shard(client, semaphore, shard) for shard in self._shards)
+            )
+
+    async def _fetch_shard(
+        self,
+        client: AsyncWebClient,
+        semaphore: asyncio.Semaphore,
+        shard: Shard,
+    ) -> None:
+        loop = asyncio.get_running_loop()
+
+        async with semaphore:
+            try:
+                cursor = None
+
+                while not self._stopped.is_set():
+                    conversation = await self._conversations_history(
+                        client,
+                        channel=self._slack_channel_id,
+                        limit=100,
+                        oldest=shard.oldest,
+                        latest=shard.latest,
+                        inclusive=True,
+                        cursor=cursor,
+                    )
+                    await loop.run_in_executor(
+                        None, self._put, shard.pages, conversation["messages"]
+                    )
+
+                    if not conversation["has_more"]:
+                        break
+
+                    cursor = conversation["response_metadata"]["next_cursor"]
+
+            except Exception as e:
+                await loop.run_in_executor(None, self._put, shard.pages, e)
+
+            finally:
+                await loop.run_in_executor(None, self._put, shard.pages, _done)
+
+    async def _conversations_history(self, client: AsyncWebClient, **kwargs) -> Dict:
+        return await call_rate_limited(client, "conversations.history", **kwargs)
+
+    def _put(self, pages: queue.Queue, item) -> None:
+        while not self._stopped.is_set():
+            try:
+                return pages.put(item, timeout=0.1)
+
+            except queue.Full:
+                continue
+
+    def _split(self, ranges: List[Tuple[float, float]]) -> List[Shard]:
+        shards = []
+
+        for range_index, (oldest, latest) in enumerate(ranges):
+            count = int(min(self._concurrency, (latest - oldest) // min_shard_seconds))
+            count = max(1, count)
+            width = (latest - oldest) / count
+
+            for i in reversed(range(count)):
+                shards.append(
+                    Shard(
+                        range_index,
+                        oldest + i * width,
+                        latest if i == count - 1 else oldest + (i + 1) * width,
+                    )
+                )
+
+        shards.sort(key=lambda shard: shard.latest, reverse=True)
+
+        return shards
+
+
+def fetch_thread_replies(
+    slack_channel_id: str,
+    thread_timestamps: List[str],
+    concurrency: int = replies_concurrency,
+) -> Dict[str, Optional[List[Dict]]]:
+    if not thread_timestamps:
+        return {}
+
+    return asyncio.run(
+        _fetch_thread_replies(slack_channel_id, thread_timestamps, max(1, concurrency))
+    )
+
+
+async def _fetch_thread_replies(
+    slack_channel_id: str, thread_timestamps: List[str], concurrency: int
+) -> Dict[str, Optional[List[Dict]]]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=concurrency)
+    ) as session:
+        client = AsyncWebClient(token=slack_client.token, session=session)
+
+        replies = await asyncio.gather(
+            *(
+                _fetch_thread(client, semaphore, slack_channel_id, thread_ts)
+                for thread_ts in thread_timestamps
+            )
+        )
+
+    return dict(zip(thread_timestamps, replies))
+
+
+async def _fetch_thread(
+    client: AsyncWebClient,
+    semaphore: asyncio.Semaphore,
+    slack_channel_id: str,
+    thread_ts: str,
+) -> Optional[List[Dict]]:
+    async with semaphore:
+        messages = []
+        cursor = None
+
+        try:
+            while True:
+                conversation = await call_rate_limited(
+                    client,
+                    "conversations.replies",
+                    channel=slack_channel_id,
+                    ts=thread_ts,
+                    limit=200,
+                    cursor=cursor,
+                )
+                messages.extend(conversation["messages"])
+
+                if not conversation.get("has_more"):
+                    return messages
+
+                cursor = conversation["response_metadata"]["next_cursor"]
+
+        except slack_errors.SlackApiError:
+            logging.exception(f"Exception while fetching replies of {thread_ts}")
+
+            return None
+
+
+async def call_rate_limited(client: AsyncWebClient, api_method: str, **kwargs) -> Dict:
+    bucket = rate_limit_bucket(api_method)
+    method = getattr(client, api_method.replace(".", "_"))
+
+    for attempt in range(max_rate_limit_retries + 1):
+        await asyncio.sleep(bucket.reserve())
+
+        try:
+            response = await method(**kwargs)
+
+        except slack_errors.SlackApiError as e:
+            if (e.response.status_code != 429) or (attempt == max_rate_limit_retries):
+                raise
+
+            retry_after = retry_after_seconds(e.response.headers)
+            logging.info(
+                f"Rate limited calling {api_method} for {kwargs.get('channel')}, retrying in {retry_after}s"
+            )
+            bucket.rate_limited(retry_after)
+
+            continue
+
+        bucket.succeeded()
+
+        return response
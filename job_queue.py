@@ -0,0 +1,131 @@
+import os
+import logging
+import threading
+from collections import OrderedDict, deque
+from dotenv import load_dotenv, find_dotenv
+from typing import Callable, Dict, Hashable, List, Optional
+
+load_dotenv(find_dotenv())
+
+QUEUED = "queued"
+DUPLICATE = "duplicate"
+REJECTED = "rejected"
+
+
+class Job:
+    def __init__(
+        self,
+        key: Hashable,
+        slack_channel_id: str,
+        slack_user_id: str,
+        target: Callable,
+        kwargs: Dict,
+    ) -> None:
+        self.key = key
+        self.slack_channel_id = slack_channel_id
+        self.slack_user_id = slack_user_id
+        self.target = target
+        self.kwargs = kwargs
+        self._recipients = [slack_user_id]
+        self._is_closed = False
+        self._lock = threading.Lock()
+
+    def add_recipient(self, slack_user_id: str) -> Optional[str]:
+        with self._lock:
+            if self._is_closed:
+                return None
+
+            if slack_user_id in self._recipients:
+                return DUPLICATE
+
+            self._recipients.append(slack_user_id)
+
+            return QUEUED
+
+    def recipients(self) -> List[str]:
+        with self._lock:
+            self._is_closed = True
+
+            return list(self._recipients)
+
+
+class JobScheduler:
+    def __init__(self, worker_count: int, max_backlog: int) -> None:
+        self._max_backlog = max_backlog
+        self._pending: OrderedDict = OrderedDict()
+        self._pending_count = 0
+        self._jobs: Dict[Hashable, Job] = {}
+        self._busy_channels = set()
+        self._condition = threading.Condition()
+
+        for i in range(worker_count):
+            threading.Thread(
+                target=self._work, name=f"job-worker-{i}", daemon=True
+            ).start()
+
+    def submit(self, job: Job) -> str:
+        with self._condition:
+            if job.key in self._jobs:
+                status = self._jobs[job.key].add_recipient(job.slack_user_id)
+
+                if status:
+                    return status
+
+            if self._pending_count >= self._max_backlog:
+                return REJECTED
+
+            self._pending.setdefault(job.slack_user_id, deque()).append(job)
+            self._pending_count += 1
+            self._jobs[job.key] = job
+            self._condition.notify()
+
+            return QUEUED
+
+    def _work(self) -> None:
+        while True:
+            with self._condition:
+                job = self._next_job()
+
+                while not job:
+                    self._condition.wait()
+                    job = self._next_job()
+
+            try:
+                job.target(**job.kwargs)
+
+            except Exception:
+                logging.exception(f"Exception while running job {job.key}")
+
+            finally:
+                with self._condition:
+                    self._busy_channels.discard(job.slack_channel_id)
+
+                    if self._jobs.get(job.key) is job:
+                        del self._jobs[job.key]
+
+                    self._condition.notify_all()
+
+    def _next_job(self) -> Optional[Job]:
+        for slack_user_id, jobs in self._pending.items():
+            for job in jobs:
+                if job.slack_channel_id in self._busy_channels:
+                    continue
+
+                jobs.remove(job)
+                self._pending_count -= 1
+                self._busy_channels.add(job.slack_channel_id)
+
+                if jobs:
+                    self._pending.move_to_end(slack_user_id)
+                else:
+                    del self._pending[slack_user_id]
+
+                return job
+
+        return None
+
+
+job_scheduler = JobScheduler(
+    worker_count=int(os.environ.get("JOB_WORKERS") or 4),
+    max_backlog=int(os.environ.get("JOB_MAX_BACKLOG") or 50),
+)
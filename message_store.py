@@ -0,0 +1,243 @@
+import os
+import json
+import time
+import sqlite3
+from dotenv import load_dotenv, find_dotenv
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from consult_record import ConsultRecord
+from consult_stats import ConsultStats
+
+load_dotenv(find_dotenv())
+
+refresh_window = float(os.environ.get("MESSAGE_STORE_REFRESH_WINDOW") or 86400)
+
+schema = """
+CREATE TABLE IF NOT EXISTS messages (
+    ts TEXT PRIMARY KEY,
+    ts_value REAL NOT NULL,
+    message TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_ts_value ON messages (ts_value);
+CREATE TABLE IF NOT EXISTS synced_ranges (
+    oldest REAL NOT NULL,
+    latest REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS deleted_messages (
+    ts_value REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS thread_replies (
+    thread_ts TEXT PRIMARY KEY,
+    latest_reply TEXT,
+    first_replies TEXT NOT NULL
+);
+"""
+
+
+class MessageStore:
+    def __init__(self, slack_channel_id: str) -> None:
+        if not os.path.isdir(f"./channels/{slack_channel_id}"):
+            os.makedirs(f"./channels/{slack_channel_id}", exist_ok=True)
+
+        self._connection = sqlite3.connect(
+            f"./channels/{slack_channel_id}/messages.db", timeout=30
+        )
+        self._connection.executescript(schema)
+
+        self._stats = ConsultStats(self._connection, slack_channel_id)
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def missing_ranges(
+        self, oldest: Optional[float], latest: Optional[float]
+    ) -> List[Tuple[float, float]]:
+        oldest = oldest or 0.0
+        latest = latest or time.time()
+
+        missing = []
+        cursor = oldest
+
+        for synced_oldest, synced_latest in self._synced_ranges():
+            if synced_latest < cursor:
+                continue
+
+            if synced_oldest > latest:
+                break
+
+            if synced_oldest > cursor:
+                missing.append((cursor, synced_oldest))
+
+            cursor = max(cursor, synced_latest)
+
+        if cursor < latest:
+            missing.append((cursor, latest))
+
+        return missing
+
+    def covered_ranges(
+        self, oldest: Optional[float], latest: Optional[float]
+    ) -> List[Tuple[float, float]]:
+        oldest = oldest or 0.0
+        latest = latest or time.time()
+
+        covered = []
+        cursor = oldest
+
+        for missing_oldest, missing_latest in self.missing_ranges(oldest, latest):
+            if missing_oldest > cursor:
+                covered.append((cursor, missing_oldest))
+
+            cursor = missing_latest
+
+        if cursor < latest:
+            covered.append((cursor, latest))
+
+        return covered
+
+    def save_messages(
+        self,
+        messages: List[Dict],
+        consult_messages: Optional[Dict[str, ConsultRecord]] = None,
+        config_version: Optional[int] = None,
+    ) -> None:
+        updated = time.time()
+
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO messages (ts, ts_value, message, updated) VALUES (?, ?, ?, ?)",
+                [
+                    (message["ts"], float(message["ts"]), json.dumps(message), updated)
+                    for message in messages
+                ],
+            )
+            self._stats.update(messages, consult_messages, config_version)
+
+    def get_message(self, ts: str) -> Optional[Dict]:
+        row = self._connection.execute(
+            "SELECT message FROM messages WHERE ts = ?", (ts,)
+        ).fetchone()
+
+        return json.loads(row[0]) if row else None
+
+    def delete_message(self, ts: str) -> None:
+        with self._connection:
+            self._delete(ts, time.time())
+
+    def delete_missing(
+        self, oldest: float, latest: float, timestamps: Set[str]
+    ) -> None:
+        # A refetched range is complete, so stored messages in it that Slack
+        # no longer returns were deleted while events were not received.
+        missing = [
+            ts
+            for (ts,) in self._connection.execute(
+                "SELECT ts FROM messages WHERE ts_value >= ? AND ts_value <= ?",
+                (oldest, latest),
+            ).fetchall()
+            if ts not in timestamps
+        ]
+
+        if not missing:
+            return
+
+        updated = time.time()
+
+        with self._connection:
+            for ts in missing:
+                self._delete(ts, updated)
+
+    def get_thread_replies(
+        self, thread_timestamps: List[str]
+    ) -> Dict[str, Tuple[Optional[str], Dict[str, float]]]:
+        threads = {}
+
+        for thread_ts in thread_timestamps:
+            row = self._connection.execute(
+                "SELECT latest_reply, first_replies FROM thread_replies WHERE thread_ts = ?",
+                (thread_ts,),
+            ).fetchone()
+
+            if row is not None:
+                threads[thread_ts] = (row[0], json.loads(row[1]))
+
+        return threads
+
+    def save_thread_replies(
+        self, threads: Dict[str, Tuple[Optional[str], Dict[str, float]]]
+    ) -> None:
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO thread_replies (thread_ts, latest_reply, first_replies) VALUES (?, ?, ?)",
+                [
+                    (thread_ts, latest_reply, json.dumps(first_replies))
+                    for thread_ts, (latest_reply, first_replies) in threads.items()
+                ],
+            )
+
+    def consult_stats(self, oldest: float, latest: float) -> Dict:
+        return self._stats.summary(oldest, latest)
+
+    def last_updated(self, oldest: Optional[float], latest: Optional[float]) -> float:
+        oldest, latest = oldest or 0.0, latest or time.time()
+        (updated,) = self._connection.execute(
+            "SELECT MAX(updated) FROM messages WHERE ts_value >= ? AND ts_value <= ?",
+            (oldest, latest),
+        ).fetchone()
+        (deleted,) = self._connection.execute(
+            "SELECT MAX(updated) FROM deleted_messages WHERE ts_value >= ? AND ts_value <= ?",
+            (oldest, latest),
+        ).fetchone()
+
+        return max(updated or 0.0, deleted or 0.0)
+
+    def mark_synced(self, oldest: float, latest: float) -> None:
+        latest = min(latest, time.time() - refresh_window)
+
+        if latest <= oldest:
+            return
+
+        merged_oldest, merged_latest = oldest, latest
+        overlapping = []
+
+        for synced_oldest, synced_latest in self._synced_ranges():
+            if synced_latest >= oldest and synced_oldest <= latest:
+                overlapping.append((synced_oldest, synced_latest))
+                merged_oldest = min(merged_oldest, synced_oldest)
+                merged_latest = max(merged_latest, synced_latest)
+
+        with self._connection:
+            self._connection.executemany(
+                "DELETE FROM synced_ranges WHERE oldest = ? AND latest = ?",
+                overlapping,
+            )
+            self._connection.execute(
+                "INSERT INTO synced_ranges (oldest, latest) VALUES (?, ?)",
+                (merged_oldest, merged_latest),
+            )
+
+    def iter_messages(
+        self, oldest: Optional[float], latest: Optional[float]
+    ) -> Iterator[Dict]:
+        rows = self._connection.execute(
+            "SELECT message FROM messages WHERE ts_value >= ? AND ts_value <= ? ORDER BY ts_value DESC",
+            (oldest or 0.0, latest or time.time()),
+        )
+
+        for (message,) in rows:
+            yield json.loads(message)
+
+    def _delete(self, ts: str, updated: float) -> None:
+        self._connection.execute("DELETE FROM messages WHERE ts = ?", (ts,))
+        self._connection.execute(
+            "INSERT INTO deleted_messages (ts_value, updated) VALUES (?, ?)",
+            (float(ts), updated),
+        )
+        self._stats.remove(ts)
+
+    def _synced_ranges(self) -> List[Tuple[float, float]]:
+        return self._connection.execute(
+            "SELECT oldest, latest FROM synced_ranges ORDER BY oldest"
+        ).fetchall()
@@ -0,0 +1,71 @@
+import math
+import time
+import threading
+from collections import deque
+from functools import wraps
+from typing import Callable, Dict, Optional
+
+
+class LatencyRecorder:
+    def __init__(self, sample_size: int = 1000) -> None:
+        self._samples = deque(maxlen=sample_size)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+            self._count += 1
+
+    def timed(self, func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+
+            try:
+                return func(*args, **kwargs)
+
+            finally:
+                self.record(time.perf_counter() - started)
+
+        return wrapper
+
+    def summary(self) -> Dict:
+        with self._lock:
+            samples = sorted(self._samples)
+            count = self._count
+
+        return {
+            "count": count,
+            "p50_ms": _milliseconds(percentile(samples, 50)),
+            "p90_ms": _milliseconds(percentile(samples, 90)),
+            "p99_ms": _milliseconds(percentile(samples, 99)),
+        }
+
+
+def percentile(samples: list, rank: float):
+    if not samples:
+        return None
+
+    index = max(0, math.ceil(rank / 100 * len(samples)) - 1)
+
+    return samples[index]
+
+
+def percentile_summary(samples: list) -> Dict:
+    samples = sorted(samples)
+
+    return {
+        "count": len(samples),
+        "p50": percentile(samples, 50),
+        "p90": percentile(samples, 90),
+        "p99": percentile(samples, 99),
+    }
+
+
+def _milliseconds(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+ack_latency = LatencyRecorder()
+event_ack_latency = LatencyRecorder()
@@ -0,0 +1,57 @@
+import os
+import sys
+import json
+import time
+import argparse
+import urllib.request
+from dotenv import load_dotenv, find_dotenv
+from slack_sdk.signature import SignatureVerifier
+
+load_dotenv(find_dotenv())
+
+
+def replay(file_name: str, url: str, delay: float) -> None:
+    signature_verifier = SignatureVerifier(os.environ["SIGNING_SECRET"])
+
+    with open(file_name, "r") as file:
+        for line in file:
+            if not line.strip():
+                continue
+
+            body = json.dumps(json.loads(line))
+            timestamp = str(int(time.time()))
+            request = urllib.request.Request(
+                url,
+                data=body.encode("utf-8"),
+                method="POST",
+                headers={
+                    "Content-Type": "application/json",
+                    "X-Slack-Request-Timestamp": timestamp,
+                    "X-Slack-Signature": signature_verifier.generate_signature(
+                        timestamp=timestamp, body=body
+                    ),
+                },
+            )
+
+            with urllib.request.urlopen(request) as response:
+                print(
+                    f"{response.status} {json.loads(body).get('event', {}).get('type')}"
+                )
+
+            time.sleep(delay)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Replay recorded Slack event payloads against the /events endpoint."
+    )
+    parser.add_argument("file", help="JSON Lines file of recorded event payloads")
+    parser.add_argument("--url", default="http://localhost:5000/events")
+    parser.add_argument("--delay", type=float, default=0.0)
+    args = parser.parse_args()
+
+    try:
+        replay(args.file, args.url, args.delay)
+
+    except KeyboardInterrupt:
+        sys.exit(1)
@@ -0,0 +1,154 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from dotenv import load_dotenv, find_dotenv
+from typing import Dict, Optional
+
+from message_store import refresh_window
+
+load_dotenv(find_dotenv())
+
+
+def cache_key(*parts) -> str:
+    return hashlib.sha256(
+        json.dumps(parts, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()[:32]
+
+
+def report_url(slack_channel_id: str, file_name: str) -> str:
+    return f"https://{os.environ['DOMAIN']}/channels/{slack_channel_id}/reports/{file_name}"
+
+
+def empty_marker(file_name: str) -> str:
+    return f".{file_name}.empty"
+
+
+class ReportCache:
+    def __init__(
+        self,
+        ttl: float,
+        channel_quota: int,
+        total_quota: int,
+        reap_interval: float,
+    ) -> None:
+        self._ttl = ttl
+        self._channel_quota = channel_quota
+        self._total_quota = total_quota
+        self._reap_interval = reap_interval
+
+        threading.Thread(target=self._run, name="report-reaper", daemon=True).start()
+
+    def is_closed(self, latest_timestamp: float) -> bool:
+        return latest_timestamp < time.time() - refresh_window
+
+    def lookup(
+        self, slack_channel_id: str, file_names: Dict[str, str]
+    ) -> Optional[Dict[str, Dict]]:
+        reports = {}
+
+        for view, file_name in file_names.items():
+            reports_dir = f"./channels/{slack_channel_id}/reports"
+
+            # A view without results writes no report, only an empty marker.
+            if self.touch(f"{reports_dir}/{empty_marker(file_name)}"):
+                reports[view] = {"is_empty": True}
+                continue
+
+            if not self.touch(f"{reports_dir}/{file_name}"):
+                return None
+
+            reports[view] = {
+                "is_empty": False,
+                "file_name": file_name,
+                "url": report_url(slack_channel_id, file_name),
+            }
+
+        return reports
+
+    def touch(self, file_path: str) -> bool:
+        try:
+            stat = os.stat(file_path)
+            os.utime(file_path, ns=(time.time_ns(), stat.st_mtime_ns))
+
+        except FileNotFoundError:
+            return False
+
+        return True
+
+    def reap(self) -> None:
+        now = time.time()
+        files = []
+
+        for slack_channel_id in os.listdir("./channels"):
+            reports_dir = f"./channels/{slack_channel_id}/reports"
+
+            if not os.path.isdir(reports_dir):
+                continue
+
+            for entry in os.scandir(reports_dir):
+                if not entry.is_file():
+                    continue
+
+                stat = entry.stat()
+                last_used = max(stat.st_atime, stat.st_mtime)
+
+                if now - last_used > self._ttl:
+                    _remove(entry.path)
+                    continue
+
+                # Reports still being written and empty markers are not counted
+                # against the quotas.
+                if entry.name.startswith("."):
+                    continue
+
+                files.append((last_used, stat.st_size, slack_channel_id, entry.path))
+
+        files.sort()
+
+        channel_sizes: Dict[str, int] = {}
+
+        for _, size, slack_channel_id, _ in files:
+            channel_sizes[slack_channel_id] = (
+                channel_sizes.get(slack_channel_id, 0) + size
+            )
+
+        total_size = sum(channel_sizes.values())
+
+        for _, size, slack_channel_id, file_path in files:
+            if (channel_sizes[slack_channel_id] <= self._channel_quota) and (
+                total_size <= self._total_quota
+            ):
+                continue
+
+            _remove(file_path)
+            channel_sizes[slack_channel_id] -= size
+            total_size -= size
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self._reap_interval)
+
+            try:
+                self.reap()
+
+            except Exception:
+                logging.exception(f"Exception while reaping reports")
+
+
+def _remove(file_path: str) -> None:
+    try:
+        os.remove(file_path)
+
+    except FileNotFoundError:
+        pass
+
+
+report_cache = ReportCache(
+    ttl=float(os.environ.get("REPORT_TTL") or 604800),
+    channel_quota=int(os.environ.get("REPORT_CHANNEL_QUOTA_MB") or 500) * 1024 * 1024,
+    total_quota=int(os.environ.get("REPORT_TOTAL_QUOTA_MB") or 5000) * 1024 * 1024,
+    reap_interval=float(os.environ.get("REPORT_REAP_INTERVAL") or 600),
+)
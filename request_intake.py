@@ -0,0 +1,52 @@
+import os
+import queue
+import logging
+import threading
+from dotenv import load_dotenv, find_dotenv
+from typing import Callable
+
+load_dotenv(find_dotenv())
+
+
+class RequestIntake:
+    def __init__(self, name: str, worker_count: int, max_backlog: int) -> None:
+        self._requests: queue.Queue = queue.Queue(maxsize=max_backlog)
+
+        for i in range(worker_count):
+            threading.Thread(
+                target=self._work, name=f"{name}-worker-{i}", daemon=True
+            ).start()
+
+    def submit(self, handler: Callable, *args) -> bool:
+        try:
+            self._requests.put_nowait((handler, args))
+
+        except queue.Full:
+            return False
+
+        return True
+
+    def _work(self) -> None:
+        while True:
+            handler, args = self._requests.get()
+
+            try:
+                handler(*args)
+
+            except Exception:
+                logging.exception(f"Exception while handling request")
+
+
+request_intake = RequestIntake(
+    "intake",
+    worker_count=int(os.environ.get("INTAKE_WORKERS") or 2),
+    max_backlog=int(os.environ.get("INTAKE_MAX_BACKLOG") or 200),
+)
+
+# Slack events get their own workers and backlog, so a burst of channel
+# activity cannot fill the backlog that slash commands are acknowledged from.
+event_intake = RequestIntake(
+    "event-intake",
+    worker_count=int(os.environ.get("EVENT_INTAKE_WORKERS") or 2),
+    max_backlog=int(os.environ.get("EVENT_INTAKE_MAX_BACKLOG") or 1000),
+)
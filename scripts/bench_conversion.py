@@ -0,0 +1,213 @@
+import os
+import sys
+import time
+import random
+import argparse
+from typing import Dict, List
+from datetime import datetime
+from dotenv import load_dotenv, find_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Slack is never called, users.info is answered by the stub client below, so
+# placeholder settings are enough when there is no .env.
+for key, value in {
+    "BOT_USER_TOKEN": "xoxb-bench",
+    "SIGNING_SECRET": "bench",
+    "WORKSPACE": "bench",
+}.items():
+    os.environ.setdefault(key, value)
+
+from channel_config import ChannelConfig
+from consult_message import ConsultMessage
+from user_cache import user_profile_cache
+from util import get_ping_word_matcher
+
+config = ChannelConfig(
+    {
+        "channel_id": "CBENCH",
+        "channel_ping_words": ["help", "urgent"],
+        "consult_agent_ids": ["UAGENT1", "UAGENT2"],
+        "reaction_for_handling": "eyes",
+        "reaction_for_invalid": "x",
+        "reaction_for_no_research": "no_entry",
+    }
+)
+
+
+class StubSlackClient:
+    def users_info(self, user: str):
+        return {
+            "user": {"profile": {"real_name": user, "email": f"{user}@example.com"}}
+        }
+
+
+def synthetic_history(count: int, seed: int):
+    rnd = random.Random(seed)
+    messages = []
+
+    for i in range(count):
+        message = {
+            "ts": f"{1640995200 + i * 30:.6f}",
+            "user": "UPOSTER",
+            "text": rnd.choice(["help please", "h e l p", "hello there", "urgent!"]),
+        }
+
+        # Roughly the mix of a busy consult channel: most messages get a
+        # reply and a handling reaction from one of the agents.
+        if rnd.random() < 0.6:
+            agent_id = rnd.choice(["UAGENT1", "UAGENT2"])
+            message["reply_users"] = [agent_id, "UOTHER"]
+            message["reactions"] = [{"name": "eyes", "users": [agent_id]}]
+
+            if rnd.random() < 0.2:
+                message["reactions"].append({"name": "x", "users": [agent_id]})
+
+        messages.append(message)
+
+    return messages
+
+
+def convert(consult_message: ConsultMessage, messages) -> None:
+    for message in messages:
+        consult_message._to_csv_row(
+            consult_message._convert_slack_message_to_consult_message(message)
+        )
+
+
+def convert_before_prepared_context(messages, utc_offset: str) -> None:
+    ping_word_matcher = get_ping_word_matcher(tuple(config["channel_ping_words"]))
+
+    for message in messages:
+        _legacy_to_csv_row(
+            _legacy_convert_slack_message_to_consult_message(
+                ping_word_matcher, message, config, utc_offset
+            )
+        )
+
+
+# The conversion as it was before the context was prepared once per report,
+# kept verbatim so the comparison measures the real baseline.
+def _legacy_convert_slack_message_to_consult_message(
+    ping_word_matcher, slack_message: Dict, config: Dict, utc_offset: str
+) -> Dict:
+    tz_info = datetime.strptime(utc_offset, "%z").tzinfo
+
+    load_dotenv(find_dotenv())
+
+    consult_message = {
+        "created": datetime.fromtimestamp(float(slack_message["ts"]), tz_info).strftime(
+            "%d/%m/%Y %H:%M:%S %Z"
+        ),
+        "has_ping_word": False,
+        "is_handled": False,
+        "topic": None,
+        "research": None,
+        "slack_link": f"https://{os.environ['WORKSPACE']}.slack.com/archives/{config['channel_id']}/p{str(slack_message['ts']).replace('.', '')}",
+        "handled_by": {},
+    }
+
+    if ping_word_matcher and ping_word_matcher(
+        "".join(slack_message["text"].split()).lower()
+    ):
+        consult_message["has_ping_word"] = True
+
+    if ("reactions" in slack_message) and ("reply_users" in slack_message):
+        if any(
+            name == config["reaction_for_handling"]
+            for name in [reaction["name"] for reaction in slack_message["reactions"]]
+        ):
+            for reaction in slack_message["reactions"]:
+                if reaction["name"] == config["reaction_for_handling"]:
+                    for reaction_user in reaction["users"]:
+                        if reaction_user == slack_message["user"]:
+                            break
+
+                        if (reaction_user in slack_message["reply_users"]) and (
+                            reaction_user in config["consult_agent_ids"]
+                        ):
+                            consult_agent = user_profile_cache.get(reaction_user)
+
+                            if consult_agent:
+                                consult_message["handled_by"]["name"] = consult_agent[
+                                    "name"
+                                ]
+                                consult_message["handled_by"]["email"] = consult_agent[
+                                    "email"
+                                ]
+
+                                consult_message["is_handled"] = True
+
+                            if not consult_message["topic"]:
+                                consult_message["topic"] = "valid"
+
+                            if not consult_message["research"]:
+                                consult_message["research"] = "provided"
+
+                if reaction["name"] == config["reaction_for_invalid"]:
+                    consult_message["topic"] = "invalid"
+
+                if reaction["name"] == config["reaction_for_no_research"]:
+                    consult_message["research"] = "none"
+
+    return consult_message
+
+
+def _legacy_to_csv_row(consult_message: Dict) -> List:
+    return [
+        consult_message["created"],
+        consult_message["has_ping_word"],
+        consult_message["is_handled"],
+        consult_message["handled_by"].get("name"),
+        consult_message["handled_by"].get("email"),
+        consult_message["topic"],
+        consult_message["research"],
+        consult_message["slack_link"],
+    ]
+
+
+def best_of(runs: int, target, *args) -> float:
+    best = float("inf")
+
+    for _ in range(runs):
+        started = time.perf_counter()
+        target(*args)
+        best = min(best, time.perf_counter() - started)
+
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure the per-message cost of converting Slack messages into report rows."
+    )
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--utc-offset", default="+0100")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    user_profile_cache._client = StubSlackClient()
+    user_profile_cache.prefetch(config["consult_agent_ids"])
+
+    messages = synthetic_history(args.messages, args.seed)
+    consult_message = ConsultMessage(
+        config,
+        oldest_date="01/01/2022",
+        latest_date="31/12/2022",
+        utc_offset=args.utc_offset,
+        slack_user_id="UBENCH",
+    )
+
+    for name, seconds in (
+        (
+            "per-message setup",
+            best_of(
+                args.runs, convert_before_prepared_context, messages, args.utc_offset
+            ),
+        ),
+        ("prepared context", best_of(args.runs, convert, consult_message, messages)),
+    ):
+        print(
+            f"{name}: {seconds:.2f}s total, {seconds / len(messages) * 1e6:.1f} us/message"
+        )
@@ -0,0 +1,103 @@
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Records are generated locally and Slack is never called, so placeholder
+# settings are enough when there is no .env.
+for key, value in {
+    "BOT_USER_TOKEN": "xoxb-bench",
+    "SIGNING_SECRET": "bench",
+    "WORKSPACE": "bench",
+    "DOMAIN": "localhost",
+}.items():
+    os.environ.setdefault(key, value)
+
+from channel_config import ChannelConfig
+from consult_message import ConsultMessage
+from consult_record import ConsultRecord
+from util import report_formats
+
+config = ChannelConfig(
+    {
+        "channel_id": "CBENCH",
+        "channel_ping_words": ["help"],
+        "consult_agent_ids": [f"UAGENT{i}" for i in range(20)],
+        "reaction_for_handling": "eyes",
+        "reaction_for_invalid": "x",
+        "reaction_for_no_research": "no_entry",
+    }
+)
+
+
+def synthetic_records(count: int, seed: int):
+    rnd = random.Random(seed)
+    records = []
+
+    for i in range(count):
+        record = ConsultRecord(1640995200.0 + i * 13.000123)
+        record.has_ping_word = rnd.random() < 0.4
+
+        if rnd.random() < 0.6:
+            agent = rnd.randrange(20)
+            record.is_handled = True
+            record.topic = "invalid" if rnd.random() < 0.1 else "valid"
+            record.research = "provided"
+            record.agent_id = f"UAGENT{agent}"
+            record.handled_by = {
+                "name": f"Agent {agent}",
+                "email": f"agent{agent}@example.com",
+            }
+
+        records.append(record)
+
+    return records
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare report size and write time of every report format."
+    )
+    parser.add_argument("--records", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    records = synthetic_records(args.records, args.seed)
+    consult_message = ConsultMessage(
+        config,
+        oldest_date="01/01/2022",
+        latest_date="31/12/2022",
+        utc_offset="+0100",
+        slack_user_id="UBENCH",
+    )
+    # The records stand in for the message store, so only formatting,
+    # compression and writing are timed.
+    consult_message.iter_consult_messages = lambda: iter(records)
+
+    working_dir = tempfile.mkdtemp()
+    os.chdir(working_dir)
+    os.makedirs(f"./channels/{config['channel_id']}/reports")
+
+    try:
+        print(f"{'format':10} {'size':>10} {'write time':>11} {'rows/s':>10}")
+
+        for report_format in report_formats:
+            file_name = f"bench.{report_format}"
+            started = time.perf_counter()
+            consult_message.generate_csv("all", file_name)
+            seconds = time.perf_counter() - started
+            size = os.path.getsize(
+                f"./channels/{config['channel_id']}/reports/{file_name}"
+            )
+
+            print(
+                f"{report_format:10} {size / 1e6:7.2f} MB {seconds:10.2f}s {len(records) / seconds:10.0f}"
+            )
+
+    finally:
+        shutil.rmtree(working_dir)
@@ -0,0 +1,102 @@
+import os
+import sys
+import time
+import bisect
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Slack is never called, conversations.history is answered by the stub below,
+# so placeholder settings are enough when there is no .env.
+for key, value in {
+    "BOT_USER_TOKEN": "xoxb-bench",
+    "SIGNING_SECRET": "bench",
+}.items():
+    os.environ.setdefault(key, value)
+
+from slack_sdk.web.async_client import AsyncWebClient
+
+import slack_transport
+from history_fetcher import HistoryFetcher
+
+start = 1640995200.0
+
+
+class StubHistory:
+    def __init__(self, count: int, step: float, latency: float) -> None:
+        # Offset from the range bounds, so no message sits exactly on the
+        # boundary between two shards.
+        self.timestamps = [start + (i + 0.5) * step for i in range(count)]
+        self.latency = latency
+        self.pages = 0
+
+    async def conversations_history(
+        self, channel, limit, oldest, latest, inclusive=True, cursor=None, **kwargs
+    ):
+        await asyncio.sleep(self.latency)
+        self.pages += 1
+
+        # Slack pages newest first, so the cursor is the exclusive upper index
+        # of the next page.
+        lower = bisect.bisect_left(self.timestamps, float(oldest))
+        upper = (
+            int(cursor)
+            if cursor
+            else bisect.bisect_right(self.timestamps, float(latest))
+        )
+        first = max(lower, upper - limit)
+
+        return {
+            "ok": True,
+            "messages": [
+                {"ts": f"{ts:.6f}", "text": "help"}
+                for ts in reversed(self.timestamps[first:upper])
+            ],
+            "has_more": first > lower,
+            "response_metadata": {"next_cursor": str(first)},
+        }
+
+
+def fetch(ranges, concurrency: int) -> int:
+    messages = 0
+
+    with HistoryFetcher("CBENCH", ranges, concurrency=concurrency) as fetcher:
+        for range_index in range(len(ranges)):
+            for page in fetcher.range_pages(range_index):
+                messages += len(page)
+
+    return messages
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure history fetch wall time against a simulated Slack API."
+    )
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--step", type=float, default=60.0)
+    parser.add_argument(
+        "--latency", type=float, default=0.05, help="seconds per history page"
+    )
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    stub = StubHistory(args.messages, args.step, args.latency)
+    AsyncWebClient.conversations_history = (
+        lambda self, **kwargs: stub.conversations_history(**kwargs)
+    )
+    # The simulated latency is the only cost being measured, so the client
+    # side rate limit is lifted.
+    slack_transport.rate_limits_per_minute["conversations.history"] = 10**9
+
+    ranges = [(start, start + args.messages * args.step)]
+
+    for concurrency in args.concurrency:
+        stub.pages = 0
+        started = time.perf_counter()
+        messages = fetch(ranges, concurrency)
+        seconds = time.perf_counter() - started
+
+        print(
+            f"concurrency {concurrency}: {messages} messages in {stub.pages} pages, {seconds:.2f}s"
+        )
@@ -1,8 +1,13 @@
 import os
 from dotenv import load_dotenv, find_dotenv
-from slack_sdk import WebClient, signature, errors as slack_errors
+from slack_sdk import signature, errors as slack_errors
+
+from slack_transport import PooledWebClient
 
 load_dotenv(find_dotenv())
 
-slack_client = WebClient(os.environ["BOT_USER_TOKEN"])
+slack_client = PooledWebClient(
+    os.environ["BOT_USER_TOKEN"],
+    pool_size=int(os.environ.get("SLACK_HTTP_POOL_SIZE") or 10),
+)
 slack_signature_verifier = signature.SignatureVerifier(os.environ["SIGNING_SECRET"])
@@ -43,6 +43,14 @@ class SlackResponse:
             blocks=self._message_blocks,
         )
 
+    def send_to(self, slack_user_ids: List[str]) -> None:
+        for slack_user_id in slack_user_ids:
+            slack_client.chat_postEphemeral(
+                channel=self._channel_id,
+                user=slack_user_id,
+                blocks=self._message_blocks,
+            )
+
     def get_message_blocks(self) -> Dict[str, List[Dict]]:
         return {"blocks": self._message_blocks}
 
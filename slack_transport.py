@@ -0,0 +1,203 @@
+import io
+import ssl
+import time
+import logging
+import threading
+import http.client
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+from urllib.error import HTTPError
+from urllib.parse import urlsplit
+from urllib.request import Request
+from slack_sdk import WebClient
+
+rate_limits_per_minute = {
+    "conversations.history": 50,
+    "conversations.replies": 50,
+    "users.info": 100,
+    "chat.postEphemeral": 100,
+}
+default_rate_limit_per_minute = 100
+max_rate_limit_retries = 10
+
+
+class RateLimitBucket:
+    def __init__(self, per_minute: float, burst: int) -> None:
+        self._rate = per_minute / 60
+        self._min_rate = self._rate / 4
+        self._max_rate = self._rate * 2
+        self._step = self._rate / 20
+        self._capacity = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+
+            if now > self._updated:
+                self._tokens = min(
+                    self._capacity, self._tokens + (now - self._updated) * self._rate
+                )
+                self._updated = now
+
+            self._tokens -= 1
+            delay = self._updated - now
+
+            if self._tokens < 0:
+                delay += -self._tokens / self._rate
+
+            return delay
+
+    def succeeded(self) -> None:
+        with self._lock:
+            self._rate = min(self._max_rate, self._rate + self._step)
+
+    def rate_limited(self, retry_after: float) -> None:
+        with self._lock:
+            self._rate = max(self._min_rate, self._rate / 2)
+            self._tokens = min(self._tokens, 1.0)
+            self._updated = max(self._updated, time.monotonic() + retry_after)
+
+
+rate_limit_buckets: Dict[str, RateLimitBucket] = {}
+rate_limit_buckets_lock = threading.Lock()
+
+
+def rate_limit_bucket(api_method: str) -> RateLimitBucket:
+    with rate_limit_buckets_lock:
+        if api_method not in rate_limit_buckets:
+            per_minute = rate_limits_per_minute.get(
+                api_method, default_rate_limit_per_minute
+            )
+            rate_limit_buckets[api_method] = RateLimitBucket(
+                per_minute, burst=max(1, per_minute // 5)
+            )
+
+        return rate_limit_buckets[api_method]
+
+
+def retry_after_seconds(headers) -> float:
+    for key, value in headers.items():
+        if key.lower() == "retry-after":
+            return float(value)
+
+    return 1.0
+
+
+class ConnectionPool:
+    def __init__(
+        self, size: int, timeout: float, ssl_context: Optional[ssl.SSLContext]
+    ) -> None:
+        self._timeout = timeout
+        self._ssl_context = ssl_context or ssl.create_default_context()
+        self._idle: Dict[Tuple[str, str], List[http.client.HTTPConnection]] = (
+            defaultdict(list)
+        )
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+
+    def request(
+        self, url: str, method: str, body: Optional[bytes], headers: Dict
+    ) -> Tuple[http.client.HTTPResponse, bytes]:
+        parts = urlsplit(url)
+        key = (parts.scheme.lower(), parts.netloc)
+        path = f"{parts.path}?{parts.query}" if parts.query else parts.path
+
+        with self._slots:
+            for attempt in range(2):
+                connection, is_reused = self._acquire(key)
+
+                try:
+                    connection.request(method, path, body=body, headers=headers)
+                    response = connection.getresponse()
+                    data = response.read()
+
+                except (ConnectionResetError, BrokenPipeError):
+                    connection.close()
+
+                    # An idle keep-alive connection may have been closed by the
+                    # server, so retry once on a fresh connection.
+                    if is_reused and attempt == 0:
+                        continue
+
+                    raise
+
+                except BaseException:
+                    connection.close()
+
+                    raise
+
+                if response.will_close:
+                    connection.close()
+                else:
+                    with self._lock:
+                        self._idle[key].append(connection)
+
+                return response, data
+
+    def _acquire(self, key: Tuple[str, str]) -> Tuple[http.client.HTTPConnection, bool]:
+        with self._lock:
+            if self._idle[key]:
+                return self._idle[key].pop(), True
+
+        scheme, netloc = key
+
+        if scheme == "https":
+            return (
+                http.client.HTTPSConnection(
+                    netloc, timeout=self._timeout, context=self._ssl_context
+                ),
+                False,
+            )
+
+        return http.client.HTTPConnection(netloc, timeout=self._timeout), False
+
+
+class PooledWebClient(WebClient):
+    def __init__(self, token: str, pool_size: int, **kwargs) -> None:
+        super().__init__(token, **kwargs)
+
+        self._pool = ConnectionPool(pool_size, self.timeout, self.ssl)
+
+    def _perform_urllib_http_request_internal(self, url: str, req: Request) -> Dict:
+        if (self.proxy is not None) or (not url.lower().startswith("http")):
+            return super()._perform_urllib_http_request_internal(url, req)
+
+        api_method = urlsplit(url).path.rsplit("/", 1)[-1]
+        bucket = rate_limit_bucket(api_method)
+
+        for attempt in range(max_rate_limit_retries + 1):
+            time.sleep(bucket.reserve())
+
+            response, body = self._pool.request(
+                url, req.get_method(), req.data, dict(req.header_items())
+            )
+
+            if (response.status != 429) or (attempt == max_rate_limit_retries):
+                break
+
+            retry_after = retry_after_seconds(response.msg)
+            logging.info(
+                f"Rate limited calling {api_method}, retrying in {retry_after}s"
+            )
+            bucket.rate_limited(retry_after)
+
+        if response.status >= 400:
+            raise HTTPError(
+                url, response.status, response.reason, response.msg, io.BytesIO(body)
+            )
+
+        bucket.succeeded()
+
+        if response.msg.get_content_type() == "application/gzip":
+            return {"status": response.status, "headers": response.msg, "body": body}
+
+        charset = response.msg.get_content_charset() or "utf-8"
+
+        return {
+            "status": response.status,
+            "headers": response.msg,
+            "body": body.decode(charset),
+        }
@@ -0,0 +1,12 @@
+import os
+
+# The repository root is a package whose __init__ builds the Flask app, and
+# pytest imports it before running any test, so it needs the settings that
+# normally come from .env.
+for key, value in {
+    "BOT_USER_TOKEN": "xoxb-test",
+    "SIGNING_SECRET": "test",
+    "WORKSPACE": "test",
+    "DOMAIN": "localhost",
+}.items():
+    os.environ.setdefault(key, value)
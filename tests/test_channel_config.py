@@ -0,0 +1,101 @@
+import os
+import json
+import threading
+
+import pytest
+
+from channel_config import ChannelConfigCache
+
+default = {"channel_id": "CTEST", "consult_agent_ids": []}
+
+
+@pytest.fixture(autouse=True)
+def working_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("./channels")
+
+
+def add_agents(caches, writes: int) -> None:
+    def write(cache, prefix):
+        for n in range(writes):
+            cache.update(
+                "CTEST",
+                lambda data: data["consult_agent_ids"].append(f"{prefix}-{n}"),
+                default,
+            )
+
+    threads = [
+        threading.Thread(target=write, args=(cache, f"U{i}"))
+        for i, cache in enumerate(caches)
+    ]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+
+def test_concurrent_updates_are_not_lost():
+    cache = ChannelConfigCache()
+
+    add_agents([cache] * 8, 10)
+
+    config = cache.get("CTEST")
+    assert config.version == 80
+    assert sorted(config["consult_agent_ids"]) == sorted(
+        f"U{i}-{n}" for i in range(8) for n in range(10)
+    )
+
+
+def test_updates_from_separate_caches_are_serialized():
+    # Each cache stands in for a separate worker process, so only the lock
+    # file keeps their read-modify-write cycles apart.
+    caches = [ChannelConfigCache() for _ in range(4)]
+
+    add_agents(caches, 10)
+
+    config = ChannelConfigCache().get("CTEST")
+    assert config.version == 40
+    assert len(set(config["consult_agent_ids"])) == 40
+
+
+def test_readers_never_see_a_partial_file():
+    cache = ChannelConfigCache()
+    cache.update("CTEST", lambda data: None, default)
+    writing = threading.Event()
+    versions = []
+
+    def read():
+        while not writing.is_set():
+            with open("./channels/CTEST/config.json") as file:
+                versions.append(json.load(file)["version"])
+
+    reader = threading.Thread(target=read)
+    reader.start()
+
+    try:
+        add_agents([cache] * 4, 25)
+
+    finally:
+        writing.set()
+        reader.join()
+
+    assert versions == sorted(versions)
+    assert cache.get("CTEST").version == 101
+    assert [
+        name for name in os.listdir("./channels/CTEST") if name.endswith(".tmp")
+    ] == []
+
+
+def test_get_reloads_a_replaced_file():
+    cache = ChannelConfigCache()
+    cache.update("CTEST", lambda data: None, default)
+
+    ChannelConfigCache().update(
+        "CTEST", lambda data: data["consult_agent_ids"].append("U1"), default
+    )
+
+    config = cache.get("CTEST")
+    assert config.version == 2
+    assert config["consult_agent_ids"] == ["U1"]
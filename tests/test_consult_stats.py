@@ -0,0 +1,163 @@
+import random
+
+import pytest
+
+from channel_config import channel_configs
+from consult_record import ConsultClassifier, ignore_subtypes
+from message_store import MessageStore
+
+config = {
+    "channel_id": "CTEST",
+    "channel_ping_words": ["help"],
+    "consult_agent_ids": ["UAGENT1", "UAGENT2"],
+    "reaction_for_handling": "eyes",
+    "reaction_for_invalid": "x",
+    "reaction_for_no_research": "no_entry",
+}
+
+start = 1640995200.0
+day = 86400.0
+
+
+@pytest.fixture(autouse=True)
+def working_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    channel_configs.update("CTEST", lambda data: None, config)
+
+
+@pytest.fixture
+def message_store():
+    message_store = MessageStore("CTEST")
+
+    yield message_store
+
+    message_store.close()
+
+
+def random_message(rnd: random.Random, ts: float):
+    message = {
+        "ts": f"{ts:.6f}",
+        "user": "UPOSTER",
+        "text": rnd.choice(["help please", "h e l p", "hello"]),
+    }
+
+    if rnd.random() < 0.6:
+        agent_id = rnd.choice(["UAGENT1", "UAGENT2", "UOTHER"])
+        message["reply_users"] = [agent_id]
+        message["reactions"] = [{"name": "eyes", "users": [agent_id]}]
+
+        if rnd.random() < 0.2:
+            message["reactions"].append(
+                {"name": rnd.choice(["x", "no_entry"]), "users": [agent_id]}
+            )
+
+    if rnd.random() < 0.05:
+        message["subtype"] = "channel_join"
+
+    return message
+
+
+def random_history(rnd: random.Random, count: int):
+    # Messages posted exactly at midnight UTC sit on the border between the
+    # daily counters and the per-message rows.
+    timestamps = {start + day * rnd.randrange(6) for _ in range(10)}
+
+    while len(timestamps) < count:
+        timestamps.add(round(start + rnd.uniform(0, 6 * day), 6))
+
+    return [random_message(rnd, ts) for ts in sorted(timestamps)]
+
+
+def brute_force_summary(messages, oldest: float, latest: float):
+    classifier = ConsultClassifier(channel_configs.get("CTEST"))
+    records = [
+        classifier.classify(message)
+        for message in messages
+        if (message.get("subtype") not in ignore_subtypes)
+        and (oldest <= float(message["ts"]) <= latest)
+    ]
+    agents = {}
+
+    for record in records:
+        if record.agent_id is not None:
+            agents[record.agent_id] = agents.get(record.agent_id, 0) + 1
+
+    handled = sum(record.is_handled for record in records)
+
+    return {
+        "total": len(records),
+        "handled": handled,
+        "unhandled": len(records) - handled,
+        "with_ping_word": sum(record.has_ping_word for record in records),
+        "invalid": sum(record.topic == "invalid" for record in records),
+        "no_research": sum(record.research == "none" for record in records),
+        "agents": dict(sorted(agents.items(), key=lambda agent: (-agent[1], agent[0]))),
+    }
+
+
+def random_ranges(rnd: random.Random, messages, count: int):
+    timestamps = [float(message["ts"]) for message in messages]
+    bounds = lambda: rnd.choice(
+        [
+            start + day * rnd.randrange(7),
+            rnd.choice(timestamps),
+            round(start + rnd.uniform(-day, 7 * day), 6),
+        ]
+    )
+    ranges = [(start - day, start + 7 * day), (start, start + day), (start, start)]
+
+    while len(ranges) < count:
+        ranges.append(tuple(sorted((bounds(), bounds()))))
+
+    return ranges
+
+
+def test_summary_matches_a_brute_force_count(message_store):
+    rnd = random.Random(1)
+    messages = random_history(rnd, 500)
+
+    for i in range(0, len(messages), 50):
+        message_store.save_messages(messages[i : i + 50])
+
+    for oldest, latest in random_ranges(rnd, messages, 200):
+        assert message_store.consult_stats(oldest, latest) == brute_force_summary(
+            messages, oldest, latest
+        ), (oldest, latest)
+
+
+def test_summary_follows_edits_and_deletions(message_store):
+    rnd = random.Random(2)
+    messages = random_history(rnd, 300)
+    message_store.save_messages(messages)
+
+    for index in rnd.sample(range(len(messages)), 60):
+        messages[index] = random_message(rnd, float(messages[index]["ts"]))
+        message_store.save_messages([messages[index]])
+
+    for message in rnd.sample(messages, 40):
+        message_store.delete_message(message["ts"])
+        messages.remove(message)
+
+    for oldest, latest in random_ranges(rnd, messages, 100):
+        assert message_store.consult_stats(oldest, latest) == brute_force_summary(
+            messages, oldest, latest
+        ), (oldest, latest)
+
+
+def test_summary_is_rebuilt_after_a_config_change(message_store):
+    rnd = random.Random(3)
+    messages = random_history(rnd, 300)
+    message_store.save_messages(messages)
+
+    channel_configs.update(
+        "CTEST",
+        lambda data: data.update(
+            channel_ping_words=["hello"], consult_agent_ids=["UAGENT1"]
+        ),
+        config,
+    )
+
+    for oldest, latest in random_ranges(rnd, messages, 50):
+        assert message_store.consult_stats(oldest, latest) == brute_force_summary(
+            messages, oldest, latest
+        ), (oldest, latest)
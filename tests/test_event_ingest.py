@@ -0,0 +1,140 @@
+import os
+
+import pytest
+
+from channel_config import channel_configs
+from event_ingest import handle_event
+from message_store import MessageStore
+
+config = {
+    "channel_id": "CTEST",
+    "channel_ping_words": ["help"],
+    "consult_agent_ids": ["UAGENT"],
+    "reaction_for_handling": "eyes",
+    "reaction_for_invalid": "x",
+    "reaction_for_no_research": "no_entry",
+}
+
+
+def payload(event):
+    return {"type": "event_callback", "event": {"channel": "CTEST", **event}}
+
+
+def reaction(event_type, user, name, ts):
+    return payload(
+        {
+            "type": event_type,
+            "user": user,
+            "reaction": name,
+            "item": {"type": "message", "channel": "CTEST", "ts": ts},
+        }
+    )
+
+
+events = [
+    payload({"type": "message", "user": "U1", "text": "help", "ts": "100.000001"}),
+    payload({"type": "message", "user": "U2", "text": "hi", "ts": "200.000001"}),
+    payload({"type": "message", "user": "U3", "text": "help!", "ts": "300.000001"}),
+    payload(
+        {
+            "type": "message",
+            "user": "UAGENT",
+            "text": "on it",
+            "ts": "150.000001",
+            "thread_ts": "100.000001",
+        }
+    ),
+    payload(
+        {
+            "type": "message",
+            "subtype": "thread_broadcast",
+            "user": "U1",
+            "text": "thanks",
+            "ts": "160.000001",
+            "thread_ts": "100.000001",
+        }
+    ),
+    reaction("reaction_added", "UAGENT", "eyes", "100.000001"),
+    reaction("reaction_added", "UAGENT", "x", "300.000001"),
+    reaction("reaction_removed", "UAGENT", "x", "300.000001"),
+    reaction("reaction_added", "U2", "eyes", "999.000001"),
+    payload(
+        {
+            "type": "message",
+            "subtype": "message_changed",
+            "message": {"user": "U2", "text": "help, edited", "ts": "200.000001"},
+        }
+    ),
+    payload(
+        {"type": "message", "subtype": "message_deleted", "deleted_ts": "300.000001"}
+    ),
+    payload({"type": "message", "subtype": "channel_join", "ts": "400.000001"}),
+]
+
+
+@pytest.fixture(autouse=True)
+def working_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    channel_configs.update("CTEST", lambda data: None, config)
+
+
+def store_state():
+    message_store = MessageStore("CTEST")
+
+    try:
+        return (
+            list(message_store.iter_messages(0.0, 1000.0)),
+            message_store.consult_stats(0.0, 1000.0),
+        )
+
+    finally:
+        message_store.close()
+
+
+def test_events_update_the_store():
+    for event in events:
+        handle_event(event)
+
+    messages, stats = store_state()
+
+    assert [message["ts"] for message in messages] == [
+        "200.000001",
+        "160.000001",
+        "100.000001",
+    ]
+    assert messages[2]["reply_users"] == ["UAGENT", "U1"]
+    assert messages[2]["latest_reply"] == "160.000001"
+    assert messages[2]["reactions"] == [
+        {"name": "eyes", "users": ["UAGENT"], "count": 1}
+    ]
+    assert messages[0]["text"] == "help, edited"
+    assert (stats["total"], stats["handled"], stats["with_ping_word"]) == (3, 1, 2)
+
+
+def test_replaying_events_leaves_the_store_unchanged():
+    for event in events:
+        handle_event(event)
+
+    state = store_state()
+
+    for event in events:
+        handle_event(event)
+
+    assert store_state() == state
+
+
+def test_redelivered_events_are_applied_once():
+    for event in events:
+        handle_event(event)
+
+    state = store_state()
+
+    os.remove("./channels/CTEST/messages.db")
+
+    # Slack retries an event until it is acknowledged, so every event may
+    # arrive more than once.
+    for event in events:
+        handle_event(event)
+        handle_event(event)
+
+    assert store_state() == state
@@ -0,0 +1,130 @@
+import threading
+
+from job_queue import DUPLICATE, QUEUED, REJECTED, Job, JobScheduler
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self.started = []
+        self.running = set()
+        self.overlaps = []
+        self.release = threading.Event()
+        self.first_started = threading.Event()
+        self.done = threading.Semaphore(0)
+        self._lock = threading.Lock()
+
+    def job(self, key, slack_channel_id="C1", slack_user_id="U1") -> Job:
+        return Job(key, slack_channel_id, slack_user_id, self.run, {"name": key})
+
+    def run(self, name) -> None:
+        with self._lock:
+            self.started.append(name)
+            self.overlaps.extend(other for other in self.running if other[0] == name[0])
+            self.running.add(name)
+
+        self.first_started.set()
+        self.release.wait(5)
+
+        with self._lock:
+            self.running.discard(name)
+
+        self.done.release()
+
+    def wait(self, count: int) -> None:
+        for _ in range(count):
+            assert self.done.acquire(timeout=5)
+
+
+def test_users_take_turns():
+    recorder = Recorder()
+    scheduler = JobScheduler(worker_count=1, max_backlog=10)
+
+    scheduler.submit(recorder.job("a0", "CA0", "UA"))
+    assert recorder.first_started.wait(5)
+
+    for key in ("a1", "a2", "a3"):
+        scheduler.submit(recorder.job(key, f"C{key.upper()}", "UA"))
+
+    scheduler.submit(recorder.job("b1", "CB1", "UB"))
+    recorder.release.set()
+    recorder.wait(5)
+
+    assert recorder.started == ["a0", "a1", "b1", "a2", "a3"]
+
+
+def test_one_job_per_channel_at_a_time():
+    recorder = Recorder()
+    scheduler = JobScheduler(worker_count=4, max_backlog=10)
+
+    # Jobs are named after their channel, so the recorder can tell when two
+    # jobs of one channel run at the same time.
+    for i in range(4):
+        scheduler.submit(recorder.job(f"x{i}", "CX", f"U{i}"))
+        scheduler.submit(recorder.job(f"y{i}", "CY", f"U{i}"))
+
+    recorder.release.set()
+    recorder.wait(8)
+
+    assert sorted(recorder.started) == sorted(
+        [f"x{i}" for i in range(4)] + [f"y{i}" for i in range(4)]
+    )
+    assert recorder.overlaps == []
+
+
+def test_duplicate_requests_join_the_queued_job():
+    recorder = Recorder()
+    scheduler = JobScheduler(worker_count=1, max_backlog=10)
+
+    scheduler.submit(recorder.job("blocker", "CB"))
+    assert recorder.first_started.wait(5)
+
+    job = recorder.job("report", "CR", "U1")
+    assert scheduler.submit(job) == QUEUED
+    assert scheduler.submit(recorder.job("report", "CR", "U1")) == DUPLICATE
+    assert scheduler.submit(recorder.job("report", "CR", "U2")) == QUEUED
+
+    recorder.release.set()
+    recorder.wait(2)
+
+    assert recorder.started == ["blocker", "report"]
+    assert job.recipients() == ["U1", "U2"]
+
+
+def test_running_job_does_not_take_new_recipients():
+    recorder = Recorder()
+    scheduler = JobScheduler(worker_count=1, max_backlog=10)
+
+    job = recorder.job("report", "CR", "U1")
+    scheduler.submit(job)
+    assert recorder.first_started.wait(5)
+
+    # The job closes its recipient list once it starts delivering, so a later
+    # request is queued as a job of its own.
+    job.recipients()
+    assert scheduler.submit(recorder.job("report", "CR", "U2")) == QUEUED
+
+    recorder.release.set()
+    recorder.wait(2)
+
+    assert recorder.started == ["report", "report"]
+
+
+def test_full_backlog_rejects_new_jobs():
+    recorder = Recorder()
+    scheduler = JobScheduler(worker_count=1, max_backlog=2)
+
+    scheduler.submit(recorder.job("running", "C0"))
+    assert recorder.first_started.wait(5)
+
+    assert scheduler.submit(recorder.job("q1", "C1")) == QUEUED
+    assert scheduler.submit(recorder.job("q2", "C2")) == QUEUED
+    assert scheduler.submit(recorder.job("q3", "C3")) == REJECTED
+    # A duplicate still joins its queued job when the backlog is full.
+    assert scheduler.submit(recorder.job("q1", "C1", "U2")) == QUEUED
+
+    recorder.release.set()
+    recorder.wait(3)
+
+    assert recorder.started == ["running", "q1", "q2"]
+    assert scheduler.submit(recorder.job("q3", "C3")) == QUEUED
+    recorder.wait(1)
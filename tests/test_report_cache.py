@@ -0,0 +1,166 @@
+import os
+import time
+
+import pytest
+
+from channel_config import ChannelConfig
+from commands import _get_report_file_names
+from report_cache import ReportCache, cache_key, empty_marker
+
+
+@pytest.fixture(autouse=True)
+def working_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    for slack_channel_id in ("CA", "CB"):
+        os.makedirs(f"./channels/{slack_channel_id}/reports")
+
+
+def report_cache(ttl=3600.0, channel_quota=10**9, total_quota=10**9) -> ReportCache:
+    return ReportCache(ttl, channel_quota, total_quota, reap_interval=3600.0)
+
+
+def write_report(slack_channel_id: str, file_name: str, size: int, age: float) -> str:
+    file_path = f"./channels/{slack_channel_id}/reports/{file_name}"
+
+    with open(file_path, "wb") as file:
+        file.write(b"x" * size)
+
+    last_used = time.time() - age
+    os.utime(file_path, (last_used, last_used))
+
+    return file_path
+
+
+class StubConsultMessage:
+    def __init__(self, revision) -> None:
+        self.revision = revision
+
+    def store_revision(self):
+        return self.revision
+
+
+def report_file_names(revision=1700000000.5, version=3, latest=None):
+    channels = [
+        (
+            ChannelConfig({"channel_id": "CA", "version": version}),
+            StubConsultMessage(revision),
+        )
+    ]
+    range_key = (1600000000.0, latest or 1600086400.0, "+0100")
+
+    return _get_report_file_names(
+        {"all": "consult", "ping": "consult_ping"}, channels, range_key, "csv"
+    )
+
+
+def reports(slack_channel_id: str):
+    return sorted(os.listdir(f"./channels/{slack_channel_id}/reports"))
+
+
+def test_cache_key_is_stable():
+    parts = ("consult", [("CA", 3, 1700000000.5)], 1, 2, "+0100", "csv")
+
+    assert cache_key(*parts) == cache_key(*parts)
+    assert len(cache_key(*parts)) == 32
+    assert cache_key({"b": 1, "a": 2}) == cache_key({"a": 2, "b": 1})
+
+
+@pytest.mark.parametrize(
+    "changed",
+    [
+        ("consult", [("CA", 4, 1700000000.5)], 1, 2, "+0100", "csv"),
+        ("consult", [("CA", 3, 1700000001.5)], 1, 2, "+0100", "csv"),
+        ("consult", [("CA", 3, 1700000000.5)], 1, 3, "+0100", "csv"),
+        ("consult", [("CA", 3, 1700000000.5)], 1, 2, "+0200", "csv"),
+        ("consult", [("CA", 3, 1700000000.5)], 1, 2, "+0100", "jsonl"),
+        ("audit", [("CA", 3, 1700000000.5)], 1, 2, "+0100", "csv"),
+    ],
+)
+def test_cache_key_changes_with_every_part(changed):
+    parts = ("consult", [("CA", 3, 1700000000.5)], 1, 2, "+0100", "csv")
+
+    assert cache_key(*changed) != cache_key(*parts)
+
+
+def test_report_file_names_follow_the_channel_data():
+    file_names = report_file_names()
+
+    assert file_names == report_file_names()
+    assert file_names["all"].startswith("consult_")
+    assert file_names["all"].endswith(".csv")
+    assert (
+        file_names["all"][len("consult_") :]
+        != file_names["ping"][len("consult_ping_") :]
+    )
+    assert report_file_names(revision=1700000001.5) != file_names
+    assert report_file_names(version=4) != file_names
+
+
+def test_report_file_names_need_a_closed_synced_range():
+    assert report_file_names(latest=time.time()) is None
+    assert report_file_names(revision=None) is None
+
+
+def test_lookup_finds_reports_and_empty_markers():
+    write_report("CA", "all.csv", 10, 0)
+    write_report("CA", empty_marker("ping.csv"), 0, 0)
+
+    found = report_cache().lookup("CA", {"all": "all.csv", "ping": "ping.csv"})
+
+    assert found["all"]["is_empty"] is False
+    assert found["all"]["file_name"] == "all.csv"
+    assert found["all"]["url"].endswith("/channels/CA/reports/all.csv")
+    assert found["ping"] == {"is_empty": True}
+
+
+def test_lookup_misses_when_any_view_is_missing():
+    write_report("CA", "all.csv", 10, 0)
+
+    assert report_cache().lookup("CA", {"all": "all.csv", "ping": "ping.csv"}) is None
+
+
+def test_lookup_marks_reports_as_used():
+    file_path = write_report("CA", "all.csv", 10, 7200)
+
+    report_cache().lookup("CA", {"all": "all.csv"})
+
+    assert time.time() - os.stat(file_path).st_atime < 60
+
+
+def test_reap_removes_expired_reports_and_markers():
+    write_report("CA", "old.csv", 10, 7200)
+    write_report("CA", empty_marker("old-empty.csv"), 0, 7200)
+    write_report("CA", "new.csv", 10, 60)
+    write_report("CA", empty_marker("new-empty.csv"), 0, 60)
+
+    report_cache().reap()
+
+    assert reports("CA") == [empty_marker("new-empty.csv"), "new.csv"]
+
+
+def test_reap_keeps_each_channel_under_its_quota():
+    for age in range(5):
+        write_report("CA", f"a{age}.csv", 100, 60 * (age + 1))
+
+    write_report("CB", "b0.csv", 100, 3000)
+
+    report_cache(channel_quota=250).reap()
+
+    # The least recently used reports go first, other channels are untouched.
+    assert reports("CA") == ["a0.csv", "a1.csv"]
+    assert reports("CB") == ["b0.csv"]
+
+
+def test_reap_keeps_all_channels_under_the_total_quota():
+    write_report("CA", "a0.csv", 100, 60)
+    write_report("CA", "a1.csv", 100, 180)
+    write_report("CB", "b0.csv", 100, 120)
+    write_report("CB", "b1.csv", 100, 240)
+    write_report("CB", ".b2.csv.tmp", 1000, 0)
+
+    report_cache(total_quota=200).reap()
+
+    # Reports still being written are not counted and not removed.
+    assert reports("CA") == ["a0.csv"]
+    assert reports("CB") == [".b2.csv.tmp", "b0.csv"]
@@ -0,0 +1,110 @@
+import itertools
+from datetime import datetime
+
+import pytest
+
+from util import CommandParseError, convert_date_to_timestamp, get_consult_command
+
+strptime_formats = [
+    f"{date_format}{time_format}"
+    for date_format in ("%d%b%Y", "%d%B%Y", "%d/%m/%Y", "%d.%m.%Y", "%d-%m-%Y")
+    for time_format in ("", ",%z", ",%H:%M", ",%H:%M%z", ",%H:%M:%S", ",%H:%M:%S%z")
+]
+
+
+def strptime_timestamp(date_string: str) -> float:
+    for date_format in strptime_formats:
+        try:
+            return datetime.strptime(date_string, date_format).timestamp()
+
+        except ValueError:
+            pass
+
+    raise ValueError("Invalid date format")
+
+
+def date_strings():
+    days = ("1", "29", "31", "32")
+    months = ("01", "2", "13", "Jan", "JANUARY", "Sept")
+    years = ("2020", "22")
+    times = ("", "8:00", "23:59:59", "24:00", "1:2:3")
+    offsets = (
+        "",
+        "+0100",
+        "-07:00",
+        "+01:00",
+        "Z",
+        "+01",
+        "+0530",
+        "-2359",
+        "+2400",
+        "+0160",
+        "+01:60",
+        "-0099",
+        "+01:00:30",
+        "+01:00:60",
+    )
+
+    for day, month, year, time, offset in itertools.product(
+        days, months, years, times, offsets
+    ):
+        for separator in ("/", ".", "-") if month[0].isdigit() else ("",):
+            date = f"{day}{separator}{month}{separator}{year}"
+
+            for comma in (",",) if (time or offset) else ("", ","):
+                yield f"{date}{comma}{time}{offset}"
+
+
+def test_convert_date_to_timestamp_matches_strptime_formats():
+    mismatches = []
+
+    for date_string in date_strings():
+        try:
+            expected = strptime_timestamp(date_string)
+
+        except ValueError:
+            expected = None
+
+        try:
+            actual = convert_date_to_timestamp.__wrapped__(date_string)
+
+        except ValueError:
+            actual = None
+
+        if actual != expected:
+            mismatches.append((date_string, expected, actual))
+
+    assert mismatches == []
+
+
+@pytest.mark.parametrize(
+    "date_string", ["01/01/2022,+0160", "01/01/2022,08:00-01:60", "01/01/2022,+010060"]
+)
+def test_convert_date_to_timestamp_rejects_out_of_range_offset(date_string):
+    with pytest.raises(ValueError):
+        convert_date_to_timestamp(date_string)
+
+
+@pytest.mark.parametrize(
+    "command, date_time",
+    [
+        ("all from 01/01/2022 to 01/02/2022", "from 01/01/2022 to 01/02/2022"),
+        ("all from01/01/2022to01/02/2022", "from 01/01/2022 to 01/02/2022"),
+        ("all from 01/01/2022to 01/02/2022", "from 01/01/2022 to 01/02/2022"),
+        ("all from01october2022to02october2022", "from 01october2022 to 02october2022"),
+        (
+            "all from01/01/2022,08:00+01:00to02/01/2022",
+            "from 01/01/2022,08:00+01:00 to 02/01/2022",
+        ),
+        ("handled on01/01/2022", "on 01/01/2022"),
+        ("handled on 01/01/2022, 08:00 +0100", "on 01/01/2022,08:00+0100"),
+    ],
+)
+def test_get_consult_command_date_range(command, date_time):
+    assert get_consult_command(command)["args"]["date_time"] == date_time
+
+
+@pytest.mark.parametrize("command", ["all from 01/01/2022", "all fromto", "all on"])
+def test_get_consult_command_rejects_incomplete_range(command):
+    with pytest.raises(CommandParseError):
+        get_consult_command(command)
@@ -0,0 +1,125 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv, find_dotenv
+from typing import Dict, Iterable, Optional
+
+from slack_config import slack_client, slack_errors
+from slack_transport import retry_after_seconds
+
+load_dotenv(find_dotenv())
+
+
+class UserProfileCache:
+    def __init__(self, client, ttl: float, max_size: int) -> None:
+        self._client = client
+        self._ttl = ttl
+        self._max_size = max_size
+        self._profiles: OrderedDict = OrderedDict()
+        self._pending: Dict[str, threading.Event] = {}
+        self._failed = set()
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, slack_user_id: str) -> Optional[Dict]:
+        while True:
+            with self._lock:
+                entry = self._profiles.get(slack_user_id)
+
+                if entry and entry["expires"] > time.monotonic():
+                    self._profiles.move_to_end(slack_user_id)
+                    return entry["profile"]
+
+                # While users.info is rate limited every caller shares one
+                # deadline and gets the bare user ID instead of retrying.
+                if time.monotonic() < self._retry_at:
+                    return unresolved_profile(slack_user_id)
+
+                pending = self._pending.get(slack_user_id)
+
+                if not pending:
+                    self._pending[slack_user_id] = threading.Event()
+                    break
+
+            pending.wait()
+
+            with self._lock:
+                if slack_user_id in self._failed:
+                    continue
+
+                if slack_user_id not in self._profiles:
+                    return None
+
+        failed = True
+
+        try:
+            try:
+                profile = self._fetch(slack_user_id)
+
+            except slack_errors.SlackApiError as e:
+                retry_after = retry_after_seconds(e.response.headers)
+                logging.warning(
+                    f"Rate limited fetching Slack user {slack_user_id}, using the bare ID for {retry_after}s"
+                )
+
+                with self._lock:
+                    self._retry_at = max(self._retry_at, time.monotonic() + retry_after)
+
+                return unresolved_profile(slack_user_id)
+
+            failed = False
+
+            if profile:
+                with self._lock:
+                    self._profiles[slack_user_id] = {
+                        "profile": profile,
+                        "expires": time.monotonic() + self._ttl,
+                    }
+                    self._profiles.move_to_end(slack_user_id)
+
+                    while len(self._profiles) > self._max_size:
+                        self._profiles.popitem(last=False)
+
+            return profile
+
+        finally:
+            with self._lock:
+                if failed:
+                    self._failed.add(slack_user_id)
+                else:
+                    self._failed.discard(slack_user_id)
+
+                self._pending.pop(slack_user_id).set()
+
+    def prefetch(self, slack_user_ids: Iterable[str]) -> None:
+        for slack_user_id in set(slack_user_ids):
+            self.get(slack_user_id)
+
+    def _fetch(self, slack_user_id: str) -> Optional[Dict]:
+        try:
+            slack_user = self._client.users_info(user=slack_user_id)
+
+        except slack_errors.SlackApiError as e:
+            if e.response.status_code == 429:
+                raise
+
+            logging.exception(f"Error fetching Slack user: {slack_user_id}")
+            return None
+
+        return {
+            "name": slack_user["user"]["profile"]["real_name"],
+            "email": slack_user["user"]["profile"]["email"],
+        }
+
+
+def unresolved_profile(slack_user_id: str) -> Dict:
+    return {"name": slack_user_id, "email": None}
+
+
+user_profile_cache = UserProfileCache(
+    slack_client,
+    ttl=float(os.environ.get("USER_PROFILE_CACHE_TTL") or 3600),
+    max_size=int(os.environ.get("USER_PROFILE_CACHE_SIZE") or 1024),
+)
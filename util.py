@@ -1,8 +1,9 @@
 from urllib.parse import parse_qs
 import re
-import os
-import json
-from typing import List, Dict
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Callable, List, Dict, Optional, Tuple
+
 
 def serialize_to_dict(data_bytes: bytes) -> Dict:
     data_str = str(data_bytes, "utf-8")
@@ -20,234 +21,284 @@ def serialize_to_dict(data_bytes: bytes) -> Dict:
     return data
 
 
-def find_keyword(word: str):
-    return re.compile(r"\b({0})\b".format(word), flags=re.IGNORECASE).search
+class CommandParseError(ValueError):
+    def __init__(self, message: str, token: Optional[str] = None) -> None:
+        super().__init__(message if token is None else f"{message} ({token})")
+
+        self.reason = message
+        self.token = token
+
+
+consult_commands = (
+    "formats",
+    "bundle",
+    "audit",
+    "stats",
+    "latency",
+    "all",
+    "handled",
+    "unhandled",
+    "with-ping-word",
+)
+report_formats = ("csv", "csv.gz", "jsonl", "jsonl.gz")
+config_commands = ("help", "get", "set", "delete")
+config_arguments = (
+    "channel_ping_words",
+    "consult_agent_ids",
+    "reaction_for_handling",
+    "reaction_for_invalid",
+    "reaction_for_no_research",
+)
+list_config_arguments = ("channel_ping_words", "consult_agent_ids")
+
+command_pattern = re.compile(r"\s*(?P<name>\S+)(?P<rest>.*)", flags=re.DOTALL)
+argument_pattern = re.compile(
+    r"--\s*(?P<key>[a-z_]+)\s*=(?P<value>(?:(?!--).)*)",
+    flags=re.IGNORECASE | re.DOTALL,
+)
+format_option_pattern = re.compile(
+    r"(?:^|\s)--\s*format\s*=\s*(?P<format>\S+)", flags=re.IGNORECASE
+)
+# Dates may also be written without spaces around the keywords, e.g.
+# "from01/01/2022to01/02/2022". Then "to" has to sit between a digit (or the
+# Z of a UTC offset) and the next day number, so "october" is never split.
+date_range_pattern = re.compile(
+    r"\s*(?:from\s*(?P<oldest>\S.*?)(?:\s+to\s+|(?<=[\dz])\s*to\s*(?=\d))(?P<latest>.+?)"
+    r"|on\s*(?P<date>\S.*?))\s*",
+    flags=re.IGNORECASE | re.DOTALL,
+)
+date_time_pattern = re.compile(
+    r"(?P<date>[^,]*)(?:,(?P<time>[^+-]*)(?P<time_zone>[+-].*)?)?", flags=re.DOTALL
+)
+
+
+@lru_cache(maxsize=256)
+def get_ping_word_matcher(ping_words: Tuple[str, ...]) -> Optional[Callable]:
+    if not ping_words:
+        return None
+
+    return re.compile(
+        "|".join(re.escape(ping_word.lower()) for ping_word in ping_words)
+    ).search
+
+
+date_pattern = re.compile(
+    r"(?P<day>\d{1,2})"
+    r"(?:(?P<month_name>[a-z]+)|(?P<separator>[/.-])(?P<month>\d{1,2})(?P=separator))"
+    r"(?P<year>\d{4})"
+    r"(?:(?P<comma>,)"
+    r"(?:(?P<hour>\d{1,2}):(?P<minute>\d{1,2})(?::(?P<second>\d{1,2}))?)?"
+    r"(?:(?P<utc>Z)|(?P<sign>[+-])(?P<offset_hours>\d{2}):?(?P<offset_minutes>[0-5]\d)"
+    r"(?::?(?P<offset_seconds>[0-5]\d))?)?)?",
+    flags=re.IGNORECASE,
+)
+
+month_numbers = {
+    name: number
+    for number, names in enumerate(
+        (
+            ("jan", "january"),
+            ("feb", "february"),
+            ("mar", "march"),
+            ("apr", "april"),
+            ("may",),
+            ("jun", "june"),
+            ("jul", "july"),
+            ("aug", "august"),
+            ("sep", "september"),
+            ("oct", "october"),
+            ("nov", "november"),
+            ("dec", "december"),
+        ),
+        start=1,
+    )
+    for name in names
+}
+
+
+@lru_cache(maxsize=1024)
+def convert_date_to_timestamp(date_string: str) -> Optional[float]:
+    if not date_string:
+        return None
+
+    match = date_pattern.fullmatch(date_string)
+
+    if not match:
+        raise ValueError("Invalid date format")
+
+    if match["comma"] and not (match["hour"] or match["utc"] or match["sign"]):
+        raise ValueError("Invalid date format")
+
+    if match["month_name"]:
+        month = month_numbers.get(match["month_name"].lower())
+
+        if not month:
+            raise ValueError("Invalid date format")
+
+    else:
+        month = int(match["month"])
 
+    if match["utc"]:
+        tz_info = timezone.utc
 
-def check_config(slack_channel_id: str) -> Dict:
-    res = {"is_config_file": False, "data": {}, "empty_keys": []}
+    elif match["sign"]:
+        offset = timedelta(
+            hours=int(match["offset_hours"]),
+            minutes=int(match["offset_minutes"]),
+            seconds=int(match["offset_seconds"] or 0),
+        )
+        tz_info = timezone(-offset if match["sign"] == "-" else offset)
 
-    if not os.path.isdir(f"./channels/{slack_channel_id}"):
-        return res
+    else:
+        tz_info = None
+
+    return datetime(
+        int(match["year"]),
+        month,
+        int(match["day"]),
+        int(match["hour"] or 0),
+        int(match["minute"] or 0),
+        int(match["second"] or 0),
+        tzinfo=tz_info,
+    ).timestamp()
+
+
+def get_date_range(command: Dict) -> Dict:
+    date_time_list = extract_dates_from_string(command["args"]["date_time"])
+
+    if len(date_time_list) == 1:
+        return {
+            "oldest_date": f"{date_time_list[0]['date']},{date_time_list[0]['time'] or '00:00'}{date_time_list[0]['time_zone'] or '+0000'}",
+            "latest_date": f"{date_time_list[0]['date']},{date_time_list[0]['time'] or '23:59:59'}{date_time_list[0]['time_zone'] or '+0000'}",
+            "utc_offset": date_time_list[0]["time_zone"] or "+0000",
+        }
 
-    with open(f"./channels/{slack_channel_id}/config.json", "r") as file:
-        config: Dict = json.load(file)
+    if len(date_time_list) == 2:
+        return {
+            "oldest_date": f"{date_time_list[0]['date']},{date_time_list[0]['time'] or '00:00'}{date_time_list[0]['time_zone'] or '+0000'}",
+            "latest_date": f"{date_time_list[1]['date']},{date_time_list[1]['time'] or '23:59:59'}{date_time_list[1]['time_zone'] or '+0000'}",
+            "utc_offset": date_time_list[0]["time_zone"]
+            or date_time_list[1]["time_zone"]
+            or "+0000",
+        }
 
-    empty_keys = []
+    raise ValueError("Invalid date value.")
 
-    for k, v in config.items():
-        if not config[k]:
-            empty_keys.append(k)
 
-    if len(empty_keys) > 0:
-        res["is_config_file"] = True
-        res["empty_keys"] = empty_keys
+def extract_dates_from_string(string: str) -> List:
+    match = date_range_pattern.fullmatch(string)
 
-        return res
+    if not match:
+        raise CommandParseError("Invalid date value.", string)
 
+    if match["date"] is not None:
+        dates = [match["date"]]
     else:
-        res["is_config_file"] = True
-        res["data"] = config
+        dates = [match["oldest"], match["latest"]]
 
-        return res
+    date_time_list = []
 
+    for date in dates:
+        date_time = date_time_pattern.fullmatch("".join(date.split()))
 
-def extract_dates_from_string(string: str) -> List:
-    if ("from" in string) and ("to" in string):
-        date_time_list = []
-        dates = string.split("from")[1].split("to")
-
-        for date in dates:
-            date_time = {"date": None, "time": None, "time_zone": None}
-
-            if (",") in date:
-                date_part = date.split(",")[0]
-                time_part = date.split(",")[1]
-                if ("+" in time_part) or ("-" in time_part):
-                    time_part_split = []
-                    if "+" in time_part:
-                        time_part_split = time_part.split("+")
-                        time_part_split[1] = "+" + time_part_split[1]
-                        date_time["time"] = time_part_split[0]
-                        date_time["time_zone"] = time_part_split[1]
-
-                    if "-" in time_part:
-                        time_part_split = time_part.split("-")
-                        time_part_split[1] = "-" + time_part_split[1]
-                        date_time["time"] = time_part_split[0]
-                        date_time["time_zone"] = time_part_split[1]
-
-                else:
-                    date_time["date"] = date_part
-                    date_time["time"] = time_part
-
-                date_time["date"] = date_part
-                date_time_list.append(date_time)
-
-            else:
-                date_time["date"] = date
-                date_time_list.append(date_time)
-
-        return date_time_list
-
-    elif "on" in string:
-        date_time_list = []
-        date = string.split("on")[1]
-        date_time = {"date": None, "time": None, "time_zone": None}
-
-        if (",") in date:
-            date_part = date.split(",")[0]
-            time_part = date.split(",")[1]
-            if ("+" in time_part) or ("-" in time_part):
-                time_part_split = []
-                if "+" in time_part:
-                    time_part_split = time_part.split("+")
-                    time_part_split[1] = "+" + time_part_split[1]
-                    date_time["time"] = time_part_split[0]
-                    date_time["time_zone"] = time_part_split[1]
-
-                if "-" in time_part:
-                    time_part_split = time_part.split("-")
-                    time_part_split[1] = "-" + time_part_split[1]
-                    date_time["time"] = time_part_split[0]
-                    date_time["time_zone"] = time_part_split[1]
-
-            else:
-                date_time["date"] = date_part
-                date_time["time"] = time_part
-
-            date_time["date"] = date_part
-            date_time_list.append(date_time)
-
-            return date_time_list
-        else:
-            date_time["date"] = date
-            date_time_list.append(date_time)
+        date_time_list.append(
+            {
+                "date": date_time["date"],
+                "time": date_time["time"],
+                "time_zone": date_time["time_zone"],
+            }
+        )
 
-            return date_time_list
-    else:
-        raise ValueError("Invalid date value.")
+    return date_time_list
 
 
 def get_config_command(string: str) -> Dict:
-    if find_keyword("help")(string):
-        return {"name": "help", "args": None}
+    name, rest = _split_command(string, config_commands)
 
-    elif find_keyword("get")(string):
-        return {"name": "get", "args": None}
+    if name in ("help", "get"):
+        return {"name": name, "args": None}
 
-    elif find_keyword("delete")(string):
-        arg_value_pair = "".join(string.split()).split("--")[1:]
+    args = {}
 
-        if len(arg_value_pair) == 0:
-            raise ValueError("Invalid argument.")
+    for key, value in _parse_arguments(rest):
+        if name == "delete" and key not in list_config_arguments:
+            raise CommandParseError("Invalid argument.", key)
 
-        separated_pair = arg_value_pair[0].split("=")
+        if key in list_config_arguments:
+            args.setdefault(key, []).extend(value.split(","))
+        else:
+            args[key] = value
 
-        if (find_keyword("channel_ping_words")(separated_pair[0])) or (
-            find_keyword("consult_agent_ids")(separated_pair[0])
-        ):
-            if "," in separated_pair[1]:
-                return {
-                    "name": "delete",
-                    "args": {separated_pair[0]: separated_pair[1].split(",")},
-                }
+    if name == "delete" and len(args) != 1:
+        raise CommandParseError("Invalid argument.", rest.strip())
 
-            else:
-                return {
-                    "name": "delete",
-                    "args": {separated_pair[0]: [separated_pair[1]]},
-                }
+    return {"name": name, "args": args}
 
-        else:
-            raise ValueError("Invalid argument.")
 
-    elif find_keyword("set")(string):
-        arg_value_pair = "".join(string.split()).split("--")[1:]
+def get_consult_command(string: str) -> Dict:
+    name, rest = _split_command(string, consult_commands)
 
-        if len(arg_value_pair) == 0:
-            raise ValueError("Invalid argument.")
+    if name == "formats":
+        return {"name": name}
 
-        args = {
-            "channel_ping_words": [],
-            "consult_agent_ids": [],
-            "reaction_for_handling": None,
-            "reaction_for_invalid": None,
-            "reaction_for_no_research": None,
-        }
+    report_format = "csv"
+    format_match = format_option_pattern.search(rest)
+
+    if format_match:
+        report_format = format_match["format"].lower()
+        rest = f"{rest[:format_match.start()]} {rest[format_match.end():]}"
 
-        for pair in arg_value_pair:
-            separated_pair = pair.split("=")
-
-            if (len(separated_pair) <= 1) or ("" in separated_pair):
-                raise ValueError("Invalid argument.")
-
-            if (
-                (find_keyword("channel_ping_words")(separated_pair[0]))
-                or (find_keyword("consult_agent_ids")(separated_pair[0]))
-                or (find_keyword("reaction_for_handling")(separated_pair[0]))
-                or (find_keyword("reaction_for_invalid")(separated_pair[0]))
-                or (find_keyword("reaction_for_no_research")(separated_pair[0]))
-            ):
-                args[separated_pair[0]] = separated_pair[1]
-
-                if separated_pair[0] == "channel_ping_words":
-                    if "," in separated_pair[1]:
-                        args["channel_ping_words"] = separated_pair[1].split(",")
-                    else:
-                        args["channel_ping_words"] = [separated_pair[1]]
-
-                if separated_pair[0] == "consult_agent_ids":
-                    if "," in separated_pair[1]:
-                        args["consult_agent_ids"] = separated_pair[1].split(",")
-                    else:
-                        args["consult_agent_ids"] = [separated_pair[1]]
-            else:
-                raise ValueError("Invalid argument.")
-
-        for k, v in args.items():
-            if k not in (
-                "channel_ping_words",
-                "consult_agent_ids",
-                "reaction_for_handling",
-                "reaction_for_invalid",
-                "reaction_for_no_research",
-            ):
-                raise ValueError("Invalid argument.")
-
-        return {"name": "set", "args": args}
+        if report_format not in report_formats:
+            raise CommandParseError("Invalid format.", format_match["format"])
 
+    match = date_range_pattern.fullmatch(rest)
+
+    if not match:
+        raise CommandParseError("Invalid date range.", rest.strip() or None)
+
+    if match["date"] is not None:
+        date_time = f"on {''.join(match['date'].split())}"
     else:
-        raise ValueError("Invalid command.")
+        date_time = f"from {''.join(match['oldest'].split())} to {''.join(match['latest'].split())}"
 
+    return {"name": name, "args": {"date_time": date_time, "format": report_format}}
 
-def get_consult_command(string: str) -> Dict:
-    if find_keyword("formats")(string):
-        return {"name": "formats"}
 
-    elif find_keyword("all")(string):
-        s = "".join(string.split())
-        split = s.split("all")
+def _split_command(string: str, commands: Tuple[str, ...]) -> Tuple[str, str]:
+    match = command_pattern.match(string)
 
-        return {"name": "all", "args": {"date_time": split[1]}}
+    if not match:
+        raise CommandParseError("Invalid command.")
 
-    elif find_keyword("handled")(string):
-        s = "".join(string.split())
-        split = s.split("handled")
+    name = match["name"].lower()
 
-        return {"name": "handled", "args": {"date_time": split[1]}}
+    if name not in commands:
+        raise CommandParseError("Invalid command.", match["name"])
 
-    elif find_keyword("unhandled")(string):
-        s = "".join(string.split())
-        split = s.split("unhandled")
+    return name, match["rest"]
 
-        return {"name": "unhandled", "args": {"date_time": split[1]}}
 
-    elif find_keyword("with-ping-word")(string):
-        s = "".join(string.split())
-        split = s.split("with-ping-word")
+def _parse_arguments(string: str) -> List[Tuple[str, str]]:
+    arguments = []
+    position = 0
+    string = string.strip()
 
-        return {"name": "with_ping_word", "args": {"date_time": split[1]}}
+    while position < len(string):
+        match = argument_pattern.match(string, position)
 
-    else:
-        raise ValueError("Invalid command.")
+        if not match:
+            raise CommandParseError("Invalid argument.", string[position:])
+
+        key = match["key"].lower()
+        value = "".join(match["value"].split())
+
+        if (key not in config_arguments) or (not value):
+            raise CommandParseError("Invalid argument.", match.group().strip())
+
+        arguments.append((key, value))
+        position = match.end()
+
+    if not arguments:
+        raise CommandParseError("Invalid argument.")
+
+    return arguments